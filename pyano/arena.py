@@ -0,0 +1,237 @@
+"""Compact, array-backed storage for formulae."""
+
+from formula import *
+
+from array import array
+
+
+# Opcodes stored in `FormulaArena`.  The meaning of a node's two integer arguments
+# depends on its opcode:
+#
+#   ZERO              unused
+#   SUCC, NOT         child handle
+#   ADD, MUL, EQ,
+#   AND, IMPLIES      handles of the two children
+#   VAR               id of the variable name
+#   FORALL            id of the variable name, handle of the body
+#   NUMERAL           handle of the base, number of successors
+_ZERO = 0
+_SUCC = 1
+_ADD = 2
+_MUL = 3
+_VAR = 4
+_EQ = 5
+_AND = 6
+_NOT = 7
+_IMPLIES = 8
+_FORALL = 9
+_NUMERAL = 10
+
+_OPCODES = {
+    Zero: _ZERO,
+    Succ: _SUCC,
+    Add: _ADD,
+    Mul: _MUL,
+    Var: _VAR,
+    Eq: _EQ,
+    And: _AND,
+    Not: _NOT,
+    Implies: _IMPLIES,
+    ForAll: _FORALL,
+    Numeral: _NUMERAL,
+}
+
+
+class FormulaArena:
+    """Stores formulae as columns of integers instead of a graph of objects.
+
+    Each node is identified by an integer handle and nodes are hash-consed, so
+    structurally identical formulae (including variable names) get the same
+    handle:
+
+    >>> arena = FormulaArena()
+    >>> h = arena.add(ForAll("x", Eq(Var("x"), Succ(Zero()))))
+    >>> h == arena.add(ForAll("x", Eq(Var("x"), Succ(Zero()))))
+    True
+    >>> print(arena.to_formula(h))
+    (forall x. (x = S(0)))
+    >>> len(arena)
+    5
+
+    Children always have smaller handles than their parents.  Arenas pickle to a
+    few flat byte strings, which makes them cheap to ship to other processes.
+
+    """
+
+    def __init__(self):
+        self._ops = array("B")
+        self._arg0 = array("q")
+        self._arg1 = array("q")
+        self._names = []
+        self._init_indices()
+
+    def _init_indices(self):
+        self._name_ids = {name: i for i, name in enumerate(self._names)}
+        self._nodes = {
+            (op, a0, a1): h
+            for h, (op, a0, a1) in enumerate(zip(self._ops, self._arg0, self._arg1))
+        }
+        # Formula objects already built by `to_formula`.
+        self._formulae = {}
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __getstate__(self):
+        return (
+            self._ops.tobytes(),
+            self._arg0.tobytes(),
+            self._arg1.tobytes(),
+            self._names,
+        )
+
+    def __setstate__(self, state):
+        ops, arg0, arg1, self._names = state
+        self._ops = array("B")
+        self._ops.frombytes(ops)
+        self._arg0 = array("q")
+        self._arg0.frombytes(arg0)
+        self._arg1 = array("q")
+        self._arg1.frombytes(arg1)
+        self._init_indices()
+
+    def _get_name_id(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def _get_handle(self, op, arg0, arg1):
+        node = (op, arg0, arg1)
+        handle = self._nodes.get(node)
+        if handle is None:
+            handle = len(self._ops)
+            self._ops.append(op)
+            self._arg0.append(arg0)
+            self._arg1.append(arg1)
+            self._nodes[node] = handle
+        return handle
+
+    def add(self, f):
+        """Adds `f` to the arena and returns its handle."""
+
+        # Handles of the subformulae of `f` converted so far, keyed by object
+        # identity.  Subformulae shared by reference are only converted once.
+        handles = {}
+        stack = [(f, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in handles:
+                continue
+
+            children = node._children()
+            if not children_done and children:
+                stack.append((node, True))
+                for child in children:
+                    stack.append((child, False))
+                continue
+
+            op = _OPCODES[type(node)]
+            if op == _ZERO:
+                args = (-1, -1)
+            elif op == _VAR:
+                args = (self._get_name_id(node.name), -1)
+            elif op == _FORALL:
+                args = (self._get_name_id(node.var), handles[id(node.body)])
+            elif op == _NUMERAL:
+                args = (handles[id(node.base)], node.n)
+            elif len(children) == 1:
+                args = (handles[id(children[0])], -1)
+            else:
+                args = (handles[id(children[0])], handles[id(children[1])])
+            handles[id(node)] = self._get_handle(op, *args)
+
+        return handles[id(f)]
+
+    def to_formula(self, handle):
+        """Returns the `Formula` stored at `handle`.
+
+        Formulae are cached, so repeated calls return the same object and
+        subformulae shared in the arena are shared between the returned formulae.
+
+        """
+
+        cached = self._formulae.get(handle)
+        if cached is not None:
+            return cached
+
+        # Find every node reachable from `handle` that hasn't been built yet.  Since
+        # children have smaller handles than their parents, building them in
+        # increasing handle order always finds the children ready.
+        ops = self._ops
+        arg0 = self._arg0
+        arg1 = self._arg1
+        formulae = self._formulae
+
+        missing = set()
+        stack = [handle]
+        while stack:
+            h = stack.pop()
+            if h in missing or h in formulae:
+                continue
+            missing.add(h)
+            op = ops[h]
+            if op == _ZERO or op == _VAR:
+                continue
+            elif op == _FORALL:
+                stack.append(arg1[h])
+            elif op == _SUCC or op == _NOT or op == _NUMERAL:
+                stack.append(arg0[h])
+            else:
+                stack.append(arg0[h])
+                stack.append(arg1[h])
+
+        for h in sorted(missing):
+            op = ops[h]
+            a0 = arg0[h]
+            a1 = arg1[h]
+            if op == _ZERO:
+                f = Zero()
+            elif op == _VAR:
+                f = Var(self._names[a0])
+            elif op == _SUCC:
+                f = Succ(formulae[a0])
+            elif op == _NOT:
+                f = Not(formulae[a0])
+            elif op == _FORALL:
+                f = ForAll(self._names[a0], formulae[a1])
+            elif op == _NUMERAL:
+                f = Numeral(a1, formulae[a0])
+            elif op == _ADD:
+                f = Add(formulae[a0], formulae[a1])
+            elif op == _MUL:
+                f = Mul(formulae[a0], formulae[a1])
+            elif op == _EQ:
+                f = Eq(formulae[a0], formulae[a1])
+            elif op == _AND:
+                f = And(formulae[a0], formulae[a1])
+            else:
+                assert op == _IMPLIES, f"Unknown opcode {op}"
+                f = Implies(formulae[a0], formulae[a1])
+            formulae[h] = f
+
+        return formulae[handle]
+
+
+def proof_to_arena(proof, arena=None):
+    """Adds every formula in `proof` to an arena.  Returns the arena and the proof
+    with each formula replaced by its handle; comments are kept as they are.
+
+    """
+
+    if arena is None:
+        arena = FormulaArena()
+    handles = [p if isinstance(p, str) else arena.add(p) for p in proof]
+    return arena, handles
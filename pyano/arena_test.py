@@ -0,0 +1,64 @@
+from arena import *
+from proof_checker import *
+from proof_builder import *
+from theorems import *
+
+import pickle
+
+
+def test_arena_round_trip():
+    f = ForAll(
+        "x",
+        Implies(
+            Eq(Add(Var("x"), Numeral(3)), Mul(Var("y"), Zero())),
+            Not(Eq(Var("x"), Var("x"))),
+        ),
+    )
+    arena = FormulaArena()
+    h = arena.add(f)
+    g = arena.to_formula(h)
+    assert str(g) == str(f)
+    assert g == f
+    assert arena.to_formula(h) is g
+
+
+def test_arena_deduplicates():
+    arena = FormulaArena()
+    x_eq_x = Eq(Var("x"), Var("x"))
+    h0 = arena.add(Implies(x_eq_x, x_eq_x))
+    assert len(arena) == 3
+    h1 = arena.add(Eq(Var("x"), Var("x")))
+    assert len(arena) == 3
+    assert arena.to_formula(h0).p is arena.to_formula(h1)
+
+    # Alpha-equivalent formulae with different names are stored separately.
+    arena.add(ForAll("x", x_eq_x))
+    arena.add(ForAll("y", Eq(Var("y"), Var("y"))))
+    assert len(arena) == 7
+
+
+def test_arena_pickle():
+    builder = ProofBuilder()
+    prove_adding_zero_commutes(builder)
+    arena, handles = proof_to_arena(builder.proof)
+
+    arena = pickle.loads(pickle.dumps(arena))
+    assert [str(arena.to_formula(h)) for h in handles] == [
+        str(p) for p in builder.proof
+    ]
+
+
+def test_arena_proof_checking():
+    builder = ProofBuilder()
+    prove_one_less_than_or_eq_two(builder)
+    arena, handles = proof_to_arena(builder.proof)
+    assert_proof_is_valid(handles, arena=arena)
+
+    handles[-1] = arena.add(Eq(Zero(), Succ(Zero())))
+    try:
+        assert_proof_is_valid(handles, arena=arena)
+    except InvalidProofError as ipe:
+        assert ipe.invalid_formula_idx == len(handles) - 1
+        return
+
+    assert False, "Expected proof verification to fail"
@@ -2,7 +2,9 @@
 
 from formula import *
 
-import itertools
+import collections
+import lru
+import sat
 
 
 def _is_general_axiom(f, inner_matcher):
@@ -18,6 +20,64 @@ def _is_general_axiom(f, inner_matcher):
             return False
 
 
+def _is_substitution_instance(p, x, value, target, bindings, depth):
+    # Returns whether `target` is equal to `p` with the free occurrences of the
+    # variable named `x` replaced by `value`, as `substitute_forall` would do it,
+    # without building the substituted formula.  `p` and `target` are nested in
+    # `depth` binders and `bindings` maps the variables bound by them to the depth
+    # of their binder, which is the same on both sides.
+    #
+    # Each entry of the stack pairs a subformula of `p` (or `value`) with the
+    # subformula of `target` at the same position and with the bindings on either
+    # side, and whether `x` is still substituted in it.
+    stack = [(p, target, bindings, bindings, depth, True)]
+    while stack:
+        a, b, a_bindings, b_bindings, depth, substituting = stack.pop()
+        if not substituting or x not in a._free_vars:
+            a_is_closed = a._free_vars.isdisjoint(a_bindings)
+            b_is_closed = b._free_vars.isdisjoint(b_bindings)
+            if a_is_closed or b_is_closed:
+                if not (a_is_closed and b_is_closed and a._key is b._key):
+                    return False
+                continue
+            substituting = False
+
+        atype = type(a)
+        if atype == Var and substituting:
+            # Free variables of `value` may be captured by binders in `p`, just like
+            # `substitute_forall` captures them.
+            stack.append((value, b, a_bindings, b_bindings, depth, False))
+        elif isinstance(a, Succ) and isinstance(b, Succ):
+            # Either side may be a `Numeral`.
+            stack.append((a.x, b.x, a_bindings, b_bindings, depth, substituting))
+        elif atype != type(b):
+            return False
+        elif atype == Var:
+            a_depth = a_bindings.get(a.name)
+            if a_depth is None or a_depth != b_bindings.get(b.name):
+                return False
+        elif atype == ForAll:
+            a_bindings = dict(a_bindings)
+            a_bindings[a.var] = depth
+            b_bindings = dict(b_bindings)
+            b_bindings[b.var] = depth
+            substituting = substituting and a.var != x
+            stack.append(
+                (a.body, b.body, a_bindings, b_bindings, depth + 1, substituting)
+            )
+        else:
+            a_children = a._children()
+            b_children = b._children()
+            if len(a_children) != len(b_children):
+                return False
+            for a_child, b_child in zip(a_children, b_children):
+                stack.append(
+                    (a_child, b_child, a_bindings, b_bindings, depth, substituting)
+                )
+
+    return True
+
+
 def _is_induction_axiom_impl(f):
     # (P(0) & (forall k. P(k) => P(k+1))) => forall x. P(x)
     if not isinstance(f, Implies):
@@ -31,75 +91,248 @@ def _is_induction_axiom_impl(f):
     if not isinstance(lhs_and, And):
         return False
 
-    if lhs_and.a != substitute_forall(rhs_forall, Zero()):
+    inductive_step = lhs_and.b
+    if not isinstance(inductive_step, ForAll) or not isinstance(
+        inductive_step.body, Implies
+    ):
         return False
 
-    inductive_step = lhs_and.b
-    if not isinstance(inductive_step, ForAll):
+    # Compares against P(0), P(k) and P(k+1) without building them.
+    p = rhs_forall.body
+    x = rhs_forall.var
+    if not _is_substitution_instance(p, x, Zero(), lhs_and.a, {}, 0):
         return False
 
     k = inductive_step.var
-    expected_inductive_step = ForAll(
-        k,
-        Implies(
-            substitute_forall(rhs_forall, Var(k)),
-            substitute_forall(rhs_forall, Succ(Var(k))),
-        ),
+    bindings = {k: 0}
+    return _is_substitution_instance(
+        p, x, Var(k), inductive_step.body.p, bindings, 1
+    ) and _is_substitution_instance(
+        p, x, Succ(Var(k)), inductive_step.body.q, bindings, 1
     )
 
-    return expected_inductive_step == inductive_step
-
 
 def is_induction_axiom(f):
     return _is_general_axiom(f, _is_induction_axiom_impl)
 
 
-def _evaluate_with_truth_assignments(f, truth_assignment):
-    def recurse(f):
-        return _evaluate_with_truth_assignments(f, truth_assignment)
+# Tautologies with at most this many atoms are checked with a truth table, larger
+# ones with `sat.solve`.
+_MAX_TRUTH_TABLE_ATOMS = 20
 
-    if f in truth_assignment:
-        return truth_assignment[f]
+# Connectives in propositional skeletons, see `_get_skeleton`.  Atoms are numbered
+# from 0 so these are negative.
+_NOT = -1
+_AND = -2
+_IMPLIES = -3
 
-    ftype = type(f)
-    if ftype == And:
-        return recurse(f.a) and recurse(f.b)
-    elif ftype == Not:
-        return not recurse(f.x)
-    elif ftype == Implies:
-        return not recurse(f.p) or recurse(f.q)
-    else:
-        raise ValueError(f"Cannot evaluate {f} with truth_assignment")
+# Maps a number of atoms to the columns of the truth table over that many atoms and
+# the mask of all its rows, see `_get_truth_table_columns`.
+_TRUTH_TABLE_COLUMNS = {}
+
+# Maps recently checked skeletons to whether they are tautologies.
+_TAUTOLOGY_CACHE = lru.LRUCache(4096)
 
+TautologyCacheInfo = collections.namedtuple(
+    "TautologyCacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+_tautology_cache_hits = 0
+_tautology_cache_misses = 0
 
-def _get_all_toplevel_preds(f):
-    ftype = type(f)
-    if ftype == ForAll or ftype == Eq:
-        yield f
-        return
 
-    if ftype == Succ or ftype == Not:
-        yield from _get_all_toplevel_preds(f.x)
-    elif ftype == Add or ftype == And:
-        yield from _get_all_toplevel_preds(f.a)
-        yield from _get_all_toplevel_preds(f.b)
-    elif ftype == Implies:
-        yield from _get_all_toplevel_preds(f.p)
-        yield from _get_all_toplevel_preds(f.q)
+def get_tautology_cache_info():
+    """Returns the hit and miss counts and the size of the tautology cache."""
+
+    return TautologyCacheInfo(
+        _tautology_cache_hits,
+        _tautology_cache_misses,
+        _TAUTOLOGY_CACHE.maxsize,
+        len(_TAUTOLOGY_CACHE),
+    )
+
+
+def clear_tautology_cache():
+    """Empties the tautology cache and resets its statistics."""
+
+    global _tautology_cache_hits, _tautology_cache_misses
+    _TAUTOLOGY_CACHE.clear()
+    _tautology_cache_hits = 0
+    _tautology_cache_misses = 0
+
+
+def _get_skeleton(f):
+    """Returns the propositional skeleton of `f` and a dict from each of its atoms,
+    the top-level `ForAll` and `Eq` subformulae, to their number.
+
+    The skeleton is a tuple listing `f` in prefix order, with atoms numbered in
+    order of first occurrence.  Raises a `ValueError` if `f` isn't propositional.
+
+    """
+
+    skeleton = []
+    atoms = {}
+    stack = [f]
+    while stack:
+        node = stack.pop()
+        ftype = type(node)
+        if ftype == Not:
+            skeleton.append(_NOT)
+            stack.append(node.x)
+        elif ftype == And:
+            skeleton.append(_AND)
+            stack.append(node.b)
+            stack.append(node.a)
+        elif ftype == Implies:
+            skeleton.append(_IMPLIES)
+            stack.append(node.q)
+            stack.append(node.p)
+        elif ftype == ForAll or ftype == Eq:
+            atom = atoms.get(node)
+            if atom is None:
+                atom = len(atoms)
+                atoms[node] = atom
+            skeleton.append(atom)
+        else:
+            raise ValueError(f"Cannot evaluate {node} as a proposition")
+    return tuple(skeleton), atoms
+
+
+def _get_truth_table_columns(num_atoms):
+    # Each column is an int with one bit per row of the truth table: bit `j` of
+    # column `i` is the value of atom `i` in row `j`.  Evaluating a skeleton over
+    # the columns evaluates it on all the rows at once.
+    columns = _TRUTH_TABLE_COLUMNS.get(num_atoms)
+    if columns is None:
+        num_rows = 1 << num_atoms
+        mask = (1 << num_rows) - 1
+        columns = []
+        for i in range(num_atoms):
+            # Atom `i` alternates between runs of `block` false and true rows.
+            block = 1 << i
+            repeat = mask // ((1 << (2 * block)) - 1)
+            columns.append(repeat * (((1 << block) - 1) << block))
+        columns = (columns, mask)
+        _TRUTH_TABLE_COLUMNS[num_atoms] = columns
+    return columns
+
+
+def _is_tautology_by_truth_table(skeleton, num_atoms):
+    columns, mask = _get_truth_table_columns(num_atoms)
+    # Evaluates the prefix form from the right, so the operands of a connective are
+    # on top of the stack when it is reached.
+    stack = []
+    for item in reversed(skeleton):
+        if item >= 0:
+            stack.append(columns[item])
+        elif item == _NOT:
+            stack.append(mask ^ stack.pop())
+        elif item == _AND:
+            stack.append(stack.pop() & stack.pop())
+        else:
+            p = stack.pop()
+            stack.append((mask ^ p) | stack.pop())
+    return stack[0] == mask
 
 
 def _is_tautology_impl(f):
-    preds = list(set(_get_all_toplevel_preds(f)))
+    # `f` is a tautology iff no assignment of truth values to its atoms makes it
+    # false, which only depends on its skeleton.  Proofs repeat the same shapes
+    # with different atoms, so verdicts are cached by skeleton.
+    global _tautology_cache_hits, _tautology_cache_misses
 
-    for truth_assignments in itertools.product([True, False], repeat=len(preds)):
-        truth_assignments_dict = dict(zip(preds, truth_assignments))
-        try:
-            result = _evaluate_with_truth_assignments(f, truth_assignments_dict)
-        except ValueError:
-            return False
-        if not result:
-            return False
-    return True
+    if isinstance(f, (ForAll, Eq)):
+        # A single atom can be false.
+        return False
+
+    try:
+        skeleton, atoms = _get_skeleton(f)
+    except ValueError:
+        return False
+
+    verdict = _TAUTOLOGY_CACHE.get(skeleton)
+    if verdict is not None:
+        _tautology_cache_hits = _tautology_cache_hits + 1
+        return verdict
+
+    _tautology_cache_misses = _tautology_cache_misses + 1
+    if len(atoms) > _MAX_TRUTH_TABLE_ATOMS:
+        verdict = _is_tautology_by_sat(f, atoms)
+    else:
+        verdict = _is_tautology_by_truth_table(skeleton, len(atoms))
+    _TAUTOLOGY_CACHE[skeleton] = verdict
+    return verdict
+
+
+def _is_tautology_by_sat(f, atoms):
+    # `f` must be propositional over `atoms`, see `_get_skeleton`.  Connectives
+    # whose value is forced by `f` being false are taken apart directly.  The rest
+    # are Tseitin-encoded: every distinct subformula gets a literal and clauses that
+    # make it equal to its connective applied to its children, and `sat.solve`
+    # searches for a falsifying assignment.
+    literals = {atom: i + 1 for atom, i in atoms.items()}
+    num_vars = len(literals)
+    clauses = []
+
+    def get_literal(f):
+        nonlocal num_vars
+        stack = [(f, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node in literals:
+                continue
+
+            ftype = type(node)
+            if ftype == Not:
+                children = (node.x,)
+            elif ftype == And:
+                children = (node.a, node.b)
+            elif ftype == Implies:
+                children = (node.p, node.q)
+            else:
+                raise ValueError(f"Cannot evaluate {node} as a proposition")
+
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+                continue
+
+            if ftype == Not:
+                literals[node] = -literals[node.x]
+                continue
+
+            num_vars = num_vars + 1
+            v = num_vars
+            a = literals[children[0]]
+            b = literals[children[1]]
+            if ftype == And:
+                # v <=> a & b
+                clauses.extend([[-v, a], [-v, b], [v, -a, -b]])
+            else:
+                # v <=> !a | b
+                clauses.extend([[-v, -a, b], [v, a], [v, -b]])
+            literals[node] = v
+        return literals[f]
+
+    # Subformulae paired with the value they must have for `f` to be false.
+    forced = [(f, False)]
+    while forced:
+        node, value = forced.pop()
+        ftype = type(node)
+        if ftype == Not:
+            forced.append((node.x, not value))
+        elif ftype == And and value:
+            forced.extend([(node.a, True), (node.b, True)])
+        elif ftype == Implies and not value:
+            forced.extend([(node.p, True), (node.q, False)])
+        elif ftype == And:
+            clauses.append([-get_literal(node.a), -get_literal(node.b)])
+        elif ftype == Implies:
+            clauses.append([-get_literal(node.p), get_literal(node.q)])
+        else:
+            lit = get_literal(node)
+            clauses.append([lit if value else -lit])
+
+    return sat.solve(num_vars, clauses) is None
 
 
 def is_tautology(f):
@@ -116,6 +349,10 @@ def _is_forall_elimination_impl(f):
     if not isinstance(f, Implies) or not isinstance(f.p, ForAll):
         return False
 
+    if f.p.var not in get_free_vars(f.p.body):
+        # Nothing to substitute.
+        return f.p.body == f.q
+
     return match_template(f.p.body, f.q, [f.p.var])
 
 
@@ -155,6 +392,9 @@ def _is_forall_split_impl(f):
     Q = f.q.p
     R = f.q.q
 
+    if get_size(Q) != get_size(P.body.p) + 1 or get_size(R) != get_size(P.body.q) + 1:
+        return False
+
     return ForAll(P.var, P.body.p) == Q and ForAll(P.var, P.body.q) == R
 
 
@@ -162,8 +402,12 @@ def is_reflexivity_axiom(f):
     return _is_general_axiom(f, _is_reflexivity_axiom_impl)
 
 
+_REFLEXIVITY_AXIOM = ForAll("x", Eq(Var("x"), Var("x")))
+
+
 def _is_reflexivity_axiom_impl(f):
-    return f == ForAll("x", Eq(Var("x"), Var("x")))
+    # Equality is alpha-equivalence, so this matches any name for x.
+    return f == _REFLEXIVITY_AXIOM
 
 
 def is_subst_axiom(f):
@@ -171,7 +415,7 @@ def is_subst_axiom(f):
 
 
 def _is_subst_axiom_impl(f):
-    # x = y => (A => B) where B is A with x replaced by Y in some places.
+    # x = y => (A => B) where B is A with x replaced by y in some places.
     if not (
         isinstance(f, Implies) and isinstance(f.p, Eq) and isinstance(f.q, Implies)
     ):
@@ -179,29 +423,50 @@ def _is_subst_axiom_impl(f):
 
     x = f.p.a
     y = f.p.b
-    a = f.q.p
-    b = f.q.q
-
-    gen_varname = get_name_generator(f)
-    varnames = []
 
-    def local_genvar():
-        nonlocal gen_varname, varnames
-        varname = gen_varname()
-        varnames.append(varname)
-        return Var(varname)
-
-    template = replace_subformula(a, x, local_genvar)
-
-    captured_formulae = {}
-    if not match_template(
-        template, b, vars_to_capture=varnames, captured_formulae=captured_formulae
-    ):
-        return False
-
-    for k, v in captured_formulae.items():
-        if not (v == x or v == y):
+    # Walks A and B in lockstep.  Each position must either be the same in both, or
+    # be x in A and y in B.  `a_bindings` and `b_bindings` map the variables bound
+    # by the enclosing `ForAll`s to the depth of their binder; an x or y that
+    # refers to one of them isn't an instance of x or y.
+    stack = [(f.q.p, f.q.q, {}, {}, 0)]
+    while stack:
+        a, b, a_bindings, b_bindings, depth = stack.pop()
+        a_is_closed = a._free_vars.isdisjoint(a_bindings)
+        b_is_closed = b._free_vars.isdisjoint(b_bindings)
+        if a_is_closed != b_is_closed:
+            # A subformula that refers to an enclosing binder on one side only can't
+            # match the other side, whatever instances of x it contains.
             return False
+        if a_is_closed:
+            if a._key is b._key or (a._key is x._key and b._key is y._key):
+                continue
+            if a._key is x._key:
+                return False
+
+        atype = type(a)
+        if isinstance(a, Succ) and isinstance(b, Succ):
+            # Either side may be a `Numeral`.
+            stack.append((a.x, b.x, a_bindings, b_bindings, depth))
+        elif atype != type(b):
+            return False
+        elif atype == Var:
+            a_depth = a_bindings.get(a.name)
+            if a_depth is None or a_depth != b_bindings.get(b.name):
+                # Free variables would have been compared above.
+                return False
+        elif atype == ForAll:
+            a_bindings = dict(a_bindings)
+            a_bindings[a.var] = depth
+            b_bindings = dict(b_bindings)
+            b_bindings[b.var] = depth
+            stack.append((a.body, b.body, a_bindings, b_bindings, depth + 1))
+        else:
+            a_children = a._children()
+            b_children = b._children()
+            if len(a_children) != len(b_children):
+                return False
+            for a_child, b_child in zip(a_children, b_children):
+                stack.append((a_child, b_child, a_bindings, b_bindings, depth))
 
     return True
 
@@ -235,6 +500,13 @@ def _gen_first_order_peano_axioms():
 
 _FIRST_ORDER_PEANO_AXIOMS = _gen_first_order_peano_axioms()
 
+# Maps the structural key of each axiom in `_FIRST_ORDER_PEANO_AXIOMS` to its name.
+# Keys are the same for alpha-equivalent formulae, so a single lookup decides
+# whether a formula is one of the axioms.
+_FIRST_ORDER_PEANO_AXIOM_NAMES = {
+    axiom._key: name for name, axiom in _FIRST_ORDER_PEANO_AXIOMS.items()
+}
+
 
 def get_peano_axiom_zero_is_not_succ():
     """forall x. 0 != S(x)."""
@@ -266,24 +538,142 @@ def get_peano_axiom_x_times_succ_y():
     return _FIRST_ORDER_PEANO_AXIOMS["x_times_succ_y"]
 
 
-def is_first_order_peano_axiom(f):
-    return f in [v for k, v in _FIRST_ORDER_PEANO_AXIOMS.items()]
+def get_first_order_peano_axiom_name(f):
+    """Returns the name of the first order Peano axiom `f` is, or None if it isn't
+    one.
 
+    >>> y = Var("y")
+    >>> get_first_order_peano_axiom_name(ForAll("y", Eq(Add(y, Zero()), y)))
+    'x_plus_zero'
+    >>> get_first_order_peano_axiom_name(ForAll("y", Eq(y, y))) is None
+    True
 
-def is_axiom(f):
-    """Returns True iff `f` is an axiom in first order logic or Peano."""
+    """
+
+    return _FIRST_ORDER_PEANO_AXIOM_NAMES.get(f._key)
+
+
+def is_first_order_peano_axiom(f):
+    return get_first_order_peano_axiom_name(f) is not None
+
+
+# Names of the axiom schemas returned by `get_axiom_schema`.
+INDUCTION = "induction"
+TAUTOLOGY = "tautology"
+FORALL_ELIMINATION = "forall_elimination"
+FORALL_INTRODUCTION = "forall_introduction"
+FORALL_SPLIT = "forall_split"
+REFLEXIVITY = "reflexivity"
+SUBST = "subst"
+FIRST_ORDER_PEANO = "first_order_peano"
+
+
+def _get_implies_schemas(p_type, q_type):
+    # The schemas that can match an `Implies` whose antecedent and consequent have
+    # types `p_type` and `q_type`, in the order `get_axiom_schema` tries them.
+    schemas = []
+    if p_type == And and q_type == ForAll:
+        schemas.append((INDUCTION, _is_induction_axiom_impl))
+    schemas.append((TAUTOLOGY, _is_tautology_impl))
+    if p_type == ForAll:
+        schemas.append((FORALL_ELIMINATION, _is_forall_elimination_impl))
+    if q_type == ForAll:
+        schemas.append((FORALL_INTRODUCTION, _is_forall_introduction_impl))
+    if p_type == ForAll and q_type == Implies:
+        schemas.append((FORALL_SPLIT, _is_forall_split_impl))
+    if p_type == Eq and q_type == Implies:
+        schemas.append((SUBST, _is_subst_axiom_impl))
+    return tuple(schemas)
+
+
+_PRED_TYPES = [Eq, And, Not, Implies, ForAll]
+
+# Maps the type of a formula, and for `Implies` the types of its operands, to the
+# schemas that can match it.
+_SCHEMAS_BY_SHAPE = {
+    (Implies, p_type, q_type): _get_implies_schemas(p_type, q_type)
+    for p_type in _PRED_TYPES
+    for q_type in _PRED_TYPES
+}
+_SCHEMAS_BY_SHAPE[Not] = ((TAUTOLOGY, _is_tautology_impl),)
+_SCHEMAS_BY_SHAPE[And] = ((TAUTOLOGY, _is_tautology_impl),)
+_SCHEMAS_BY_SHAPE[ForAll] = ((REFLEXIVITY, _is_reflexivity_axiom_impl),)
+
+
+def get_axiom_schema(f):
+    """Returns the name of the axiom schema `f` is an instance of, or None if `f`
+    isn't an axiom.
+
+    >>> get_axiom_schema(ForAll("x", Eq(Var("x"), Var("x"))))
+    'reflexivity'
+    >>> p = Eq(Var("x"), Zero())
+    >>> get_axiom_schema(ForAll("x", Implies(ForAll("y", p), p)))
+    'forall_elimination'
+    >>> get_axiom_schema(Eq(Zero(), Zero())) is None
+    True
+
+    Schemas may match any formula in the quantifier prefix of `f` (see
+    `_is_general_axiom`); the outermost match is returned.  Only the schemas that
+    fit the shape of each formula are tried.
+
+    """
 
     assert isinstance(
         f, Formula
     ), f"Expected `f` to be a Formula instead found {type(f)}"
 
-    return (
-        is_induction_axiom(f)
-        or is_tautology(f)
-        or is_forall_elimination(f)
-        or is_forall_introduction(f)
-        or is_forall_split(f)
-        or is_reflexivity_axiom(f)
-        or is_subst_axiom(f)
-        or is_first_order_peano_axiom(f)
-    )
+    if is_first_order_peano_axiom(f):
+        return FIRST_ORDER_PEANO
+
+    if len(get_free_vars(f)) != 0:
+        return None
+
+    while True:
+        ftype = type(f)
+        if ftype == Implies:
+            schemas = _SCHEMAS_BY_SHAPE[(Implies, type(f.p), type(f.q))]
+        else:
+            schemas = _SCHEMAS_BY_SHAPE.get(ftype, ())
+
+        for name, matcher in schemas:
+            if matcher(f):
+                return name
+
+        if ftype != ForAll:
+            return None
+        f = f.body
+
+
+# Maps the name of each axiom schema to the function that checks whether a formula
+# is an instance of it.
+_SCHEMA_CHECKERS = {
+    INDUCTION: is_induction_axiom,
+    TAUTOLOGY: is_tautology,
+    FORALL_ELIMINATION: is_forall_elimination,
+    FORALL_INTRODUCTION: is_forall_introduction,
+    FORALL_SPLIT: is_forall_split,
+    REFLEXIVITY: is_reflexivity_axiom,
+    SUBST: is_subst_axiom,
+    FIRST_ORDER_PEANO: is_first_order_peano_axiom,
+}
+
+
+def is_axiom_of_schema(f, schema):
+    """Returns True iff `f` is an instance of the axiom schema named `schema`, one
+    of the names returned by `get_axiom_schema`.  Only that schema is checked.
+
+    >>> is_axiom_of_schema(ForAll("x", Eq(Var("x"), Var("x"))), REFLEXIVITY)
+    True
+    >>> is_axiom_of_schema(ForAll("x", Eq(Var("x"), Var("x"))), TAUTOLOGY)
+    False
+
+    """
+
+    checker = _SCHEMA_CHECKERS.get(schema)
+    return checker is not None and checker(f)
+
+
+def is_axiom(f):
+    """Returns True iff `f` is an axiom in first order logic or Peano."""
+
+    return get_axiom_schema(f) is not None
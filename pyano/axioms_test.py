@@ -1,5 +1,12 @@
 from axioms import *
 from formula_helpers import *
+from proof_parser import *
+from random_formulae_test import *
+
+import axioms
+import itertools
+import os
+import random
 
 
 def test_is_induction_axiom_0():
@@ -60,6 +67,62 @@ def test_is_induction_axiom_3():
     assert not is_induction_axiom(induction)
 
 
+def _is_induction_axiom_by_substitution(f):
+    # The original recognizer, which builds P(0), P(k) and P(k+1) and compares
+    # them against the axiom.
+    if not (
+        isinstance(f, Implies)
+        and isinstance(f.q, ForAll)
+        and isinstance(f.p, And)
+        and isinstance(f.p.b, ForAll)
+    ):
+        return False
+    if f.p.a != substitute_forall(f.q, Zero()):
+        return False
+    k = f.p.b.var
+    p_k = substitute_forall(f.q, Var(k))
+    p_succ_k = substitute_forall(f.q, Succ(Var(k)))
+    return f.p.b == ForAll(k, Implies(p_k, p_succ_k))
+
+
+def test_is_induction_axiom_matches_substitution():
+    rng = random.Random(0)
+    names = ["x", "k", "v"]
+
+    def rename_binders(f):
+        # Returns a formula equal to `f` with some of its binders renamed.
+        if isinstance(f, ForAll) and f.var not in get_bound_vars(f.body):
+            var = rng.choice([f.var, "w"])
+            if var not in get_free_vars(f.body):
+                body = substitute_free_var(f.body, f.var, Var(var))
+                return ForAll(var, rename_binders(body))
+            return ForAll(f.var, rename_binders(f.body))
+        elif isinstance(f, Not):
+            return Not(rename_binders(f.x))
+        elif isinstance(f, Implies):
+            return Implies(rename_binders(f.p), rename_binders(f.q))
+        return f
+
+    def instantiate(rhs, value):
+        choice = rng.random()
+        if choice < 0.1:
+            value = rng.choice([Zero(), Var("k"), Var("v"), Succ(Var("k"))])
+        elif choice < 0.2:
+            rhs = ForAll(rhs.var, random_pred(rng, names, 1))
+        return rename_binders(substitute_forall(rhs, value))
+
+    num_axioms = 0
+    for _ in range(1000):
+        rhs = ForAll(rng.choice(names), random_pred(rng, names, 3))
+        k = rng.choice(names)
+        step = Implies(instantiate(rhs, Var(k)), instantiate(rhs, Succ(Var(k))))
+        f = Implies(And(instantiate(rhs, Zero()), ForAll(k, step)), rhs)
+        expected = _is_induction_axiom_by_substitution(f)
+        assert axioms._is_induction_axiom_impl(f) == expected, str(f)
+        num_axioms = num_axioms + expected
+    assert 300 < num_axioms < 900
+
+
 def test_is_tautology_0():
     pred = Eq(Var("x"), Var("y"))
     taut = ForAllN(["x", "y"], Or(pred, Not(pred)))
@@ -228,6 +291,112 @@ def test_is_subst_axiom_2():
     assert is_subst_axiom(axiom)
 
 
+def test_is_subst_axiom_binders():
+    x = Var("x")
+    y = Var("y")
+
+    # Instances of x under a binder that doesn't capture it can be replaced.
+    qp = ForAll("z", Eq(Add(x, Var("z")), Var("z")))
+    qq = ForAll("w", Eq(Add(y, Var("w")), Var("w")))
+    axiom = ForAllN(["x", "y"], Implies(Eq(x, y), Implies(qp, qq)))
+    assert is_subst_axiom(axiom)
+
+    # Under "forall x." the x in the body isn't the x in "x = y".
+    qp = ForAll("x", Eq(x, Zero()))
+    qq = ForAll("x", Eq(y, Zero()))
+    axiom = ForAllN(["x", "y"], Implies(Eq(x, y), Implies(qp, qq)))
+    assert not is_subst_axiom(axiom)
+
+    # Nor is y allowed to be captured.
+    qp = ForAll("y", Eq(x, Var("y")))
+    qq = ForAll("y", Eq(y, Var("y")))
+    axiom = ForAllN(["x", "y"], Implies(Eq(x, y), Implies(qp, qq)))
+    assert not is_subst_axiom(axiom)
+
+
+def _is_subst_axiom_by_template(f):
+    # The original recognizer, which builds a template from A with every instance of
+    # x replaced by a fresh variable and matches it against B.
+    x = f.p.a
+    y = f.p.b
+    gen_varname = get_name_generator(f)
+    varnames = []
+
+    def local_genvar():
+        varname = gen_varname()
+        varnames.append(varname)
+        return Var(varname)
+
+    template = replace_subformula(f.q.p, x, local_genvar)
+    captured_formulae = {}
+    if not match_template(
+        template, f.q.q, vars_to_capture=varnames, captured_formulae=captured_formulae
+    ):
+        return False
+    return all(v == x or v == y for v in captured_formulae.values())
+
+
+def test_is_subst_axiom_matches_template():
+    rng = random.Random(0)
+    free_vars = ["u", "v"]
+    # Binders never capture the free variables of x and y, where the original
+    # recognizer got binders wrong, and never clash with the fresh names it
+    # generated for its template.
+    bound_vars = ["p0", "q0"]
+
+    def random_pair(x, y, depth, bound, is_pred):
+        # Returns (A, B) where B is A with some instances of x replaced by y, and
+        # with an occasional mistake.
+        if not is_pred:
+            choice = rng.random()
+            if choice < 0.3:
+                return x, rng.choice([x, y, y, y])
+            elif choice < 0.35:
+                return y, x
+            elif choice < 0.4:
+                return random_term(rng, free_vars + bound, 2), random_term(
+                    rng, free_vars + bound, 2
+                )
+            elif depth == 0 or choice < 0.6:
+                term = random_term(rng, free_vars + bound, 1)
+                return term, term
+            elif choice < 0.7:
+                a, b = random_pair(x, y, depth - 1, bound, False)
+                return Succ(a), Succ(b)
+            term_type = Add if choice < 0.85 else Mul
+            a0, b0 = random_pair(x, y, depth - 1, bound, False)
+            a1, b1 = random_pair(x, y, depth - 1, bound, False)
+            return term_type(a0, a1), term_type(b0, b1)
+
+        choice = rng.random()
+        if depth == 0 or choice < 0.3:
+            a0, b0 = random_pair(x, y, depth, bound, False)
+            a1, b1 = random_pair(x, y, depth, bound, False)
+            return Eq(a0, a1), Eq(b0, b1)
+        elif choice < 0.5:
+            var = rng.choice(bound_vars)
+            a, b = random_pair(x, y, depth - 1, bound + [var], True)
+            return ForAll(var, a), ForAll(var, b)
+        elif choice < 0.6:
+            a, b = random_pair(x, y, depth - 1, bound, True)
+            return Not(a), Not(b)
+        pred_type = And if choice < 0.8 else Implies
+        a0, b0 = random_pair(x, y, depth - 1, bound, True)
+        a1, b1 = random_pair(x, y, depth - 1, bound, True)
+        return pred_type(a0, a1), pred_type(b0, b1)
+
+    num_axioms = 0
+    for _ in range(1000):
+        x = random_term(rng, free_vars, 2)
+        y = random_term(rng, free_vars, 2)
+        a, b = random_pair(x, y, 4, [], True)
+        f = Implies(Eq(x, y), Implies(a, b))
+        expected = _is_subst_axiom_by_template(f)
+        assert axioms._is_subst_axiom_impl(f) == expected, str(f)
+        num_axioms = num_axioms + expected
+    assert 100 < num_axioms < 900
+
+
 def test_eq_transitive():
     x = Var("x")
     y = Var("y")
@@ -253,6 +422,7 @@ def test_first_order_peano_0():
     axiom = ForAll("x", Not(Eq(Zero(), Succ(Var("x")))))
 
     assert is_first_order_peano_axiom(axiom)
+    assert get_first_order_peano_axiom_name(axiom) == "zero_is_not_succ"
     assert is_axiom(axiom)
 
 
@@ -260,9 +430,25 @@ def test_first_order_peano_1():
     axiom = ForAll("x", Not(Eq(Zero(), Var("x"))))
 
     assert not is_first_order_peano_axiom(axiom)
+    assert get_first_order_peano_axiom_name(axiom) is None
     assert not is_axiom(axiom)
 
 
+def test_first_order_peano_names():
+    axioms = [
+        ("zero_is_not_succ", get_peano_axiom_zero_is_not_succ()),
+        ("succ_is_injective", get_peano_axiom_succ_is_injective()),
+        ("x_plus_zero", get_peano_axiom_x_plus_zero()),
+        ("x_plus_succ_y", get_peano_axiom_x_plus_succ_y()),
+        ("x_times_zero", get_peano_axiom_x_times_zero()),
+        ("x_times_succ_y", get_peano_axiom_x_times_succ_y()),
+    ]
+    for name, axiom in axioms:
+        assert get_first_order_peano_axiom_name(axiom) == name
+        assert get_first_order_peano_axiom_name(canonicalize_bound_vars(axiom)) == name
+        assert get_first_order_peano_axiom_name(axiom.body) is None
+
+
 def test_all_peano_axioms_parse():
     get_peano_axiom_zero_is_not_succ()
     get_peano_axiom_succ_is_injective()
@@ -270,3 +456,156 @@ def test_all_peano_axioms_parse():
     get_peano_axiom_x_plus_succ_y()
     get_peano_axiom_x_times_zero()
     get_peano_axiom_x_times_succ_y()
+
+
+def _is_tautology_by_truth_table(f):
+    atoms = []
+    stack = [f]
+    while stack:
+        g = stack.pop()
+        if isinstance(g, (Eq, ForAll)):
+            if g not in atoms:
+                atoms.append(g)
+        else:
+            stack.extend(g._children())
+
+    def evaluate(g, values):
+        if isinstance(g, (Eq, ForAll)):
+            return values[atoms.index(g)]
+        elif isinstance(g, Not):
+            return not evaluate(g.x, values)
+        elif isinstance(g, And):
+            return evaluate(g.a, values) and evaluate(g.b, values)
+        return not evaluate(g.p, values) or evaluate(g.q, values)
+
+    return all(
+        evaluate(f, values)
+        for values in itertools.product([False, True], repeat=len(atoms))
+    )
+
+
+def test_is_tautology_matches_truth_table(monkeypatch):
+    # Checks both the bit-parallel truth table and the SAT solver.
+    for max_truth_table_atoms in [0, 20]:
+        monkeypatch.setattr(axioms, "_MAX_TRUTH_TABLE_ATOMS", max_truth_table_atoms)
+        clear_tautology_cache()
+        _check_is_tautology_matches_truth_table()
+
+
+def _check_is_tautology_matches_truth_table():
+    rng = random.Random(0)
+    atoms = [
+        Eq(Zero(), Zero()),
+        Eq(Var("x"), Zero()),
+        ForAll("y", Eq(Var("y"), Zero())),
+        ForAll("z", Eq(Var("z"), Zero())),
+    ]
+
+    def random_pred(depth):
+        if depth == 0 or rng.random() < 0.2:
+            return rng.choice(atoms)
+        kind = rng.choice([Not, And, Implies])
+        if kind == Not:
+            return Not(random_pred(depth - 1))
+        return kind(random_pred(depth - 1), random_pred(depth - 1))
+
+    num_tautologies = 0
+    for _ in range(1000):
+        f = random_pred(5)
+        expected = _is_tautology_by_truth_table(f)
+        assert is_tautology(ForAll("x", f)) == expected, str(f)
+        num_tautologies = num_tautologies + expected
+    assert num_tautologies > 50
+
+
+def test_is_tautology_many_atoms():
+    atoms = [Eq(Var("x"), Numeral(i)) for i in range(1, 61)]
+
+    # A1 => (A1 => A2) => (A2 => A3) => ... => A60
+    def chain(links):
+        f = atoms[-1]
+        for a, b in reversed(links):
+            f = Implies(Implies(a, b), f)
+        return ForAll("x", Implies(atoms[0], f))
+
+    links = list(zip(atoms, atoms[1:]))
+    assert is_tautology(chain(links))
+    assert not is_tautology(chain(links[:30] + links[31:]))
+
+    # (A1 & A2 & ... & A60) => (A60 & ... & A1)
+    lhs = atoms[0]
+    rhs = atoms[-1]
+    for a, b in zip(atoms[1:], reversed(atoms[:-1])):
+        lhs = And(lhs, a)
+        rhs = And(rhs, b)
+    assert is_tautology(ForAll("x", Implies(lhs, rhs)))
+    assert not is_tautology(ForAll("x", Implies(rhs.a, lhs)))
+
+
+def test_tautology_cache(monkeypatch):
+    monkeypatch.setattr(axioms._TAUTOLOGY_CACHE, "maxsize", 2)
+    clear_tautology_cache()
+
+    def swap(a, b, c):
+        # (A => B => C) => (B => A => C)
+        return Implies(ImpliesN(a, b, c), ImpliesN(b, a, c))
+
+    x = Eq(Var("x"), Zero())
+    y = Eq(Var("y"), Zero())
+    z = ForAll("z", Eq(Var("z"), Var("z")))
+    assert is_tautology(ForAllN(["x", "y"], swap(x, y, z)))
+    assert is_tautology(ForAllN(["x", "y"], swap(y, z, x)))
+    assert get_tautology_cache_info() == (1, 1, 2, 1)
+
+    # A repeated atom changes the skeleton.
+    assert is_tautology(ForAll("x", swap(x, x, z)))
+    assert not is_tautology(ForAll("x", Implies(x, Not(x))))
+    assert get_tautology_cache_info() == (1, 3, 2, 2)
+
+    # The least recently used skeleton was evicted.
+    assert is_tautology(ForAllN(["x", "y"], swap(z, y, x)))
+    assert get_tautology_cache_info() == (1, 4, 2, 2)
+
+
+def test_get_axiom_schema():
+    x = Var("x")
+    p = Eq(x, Zero())
+    assert get_axiom_schema(gen_induction_axiom("x", p)) == INDUCTION
+    assert get_axiom_schema(ForAll("x", Implies(p, p))) == TAUTOLOGY
+    assert get_axiom_schema(Implies(ForAll("x", p), Eq(Zero(), Zero()))) == (
+        FORALL_ELIMINATION
+    )
+    assert get_axiom_schema(
+        Implies(Eq(Zero(), Zero()), ForAll("x", Eq(Zero(), Zero())))
+    ) == (FORALL_INTRODUCTION)
+    assert get_axiom_schema(get_peano_axiom_x_plus_zero()) == FIRST_ORDER_PEANO
+    assert get_axiom_schema(p) is None
+    assert get_axiom_schema(ForAll("x", Implies(p, Not(p)))) is None
+
+
+def test_get_axiom_schema_matches_checkers():
+    root_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "proved_theorems"
+    )
+    checkers = {
+        INDUCTION: is_induction_axiom,
+        TAUTOLOGY: is_tautology,
+        FORALL_ELIMINATION: is_forall_elimination,
+        FORALL_INTRODUCTION: is_forall_introduction,
+        FORALL_SPLIT: is_forall_split,
+        REFLEXIVITY: is_reflexivity_axiom,
+        SUBST: is_subst_axiom,
+        FIRST_ORDER_PEANO: is_first_order_peano_axiom,
+    }
+    schemas_seen = set()
+    with open(os.path.join(root_dir, "addition_is_commutative.proof"), "r") as f:
+        proof = parse_proof(f.read())
+    for formula in proof:
+        schema = get_axiom_schema(formula)
+        if schema is None:
+            assert not any(checker(formula) for checker in checkers.values())
+        else:
+            assert checkers[schema](formula)
+            assert is_axiom_of_schema(formula, schema)
+            schemas_seen.add(schema)
+    assert schemas_seen == set(checkers)
@@ -1,30 +1,286 @@
 """Core data structures to represent first order formulas."""
 
+import contextlib
+import inspect
+import lru
 import string
+import weakref
 
 
-class Formula:
-    """Base class for all formula sub-classes."""
+# When not None, maps a node's constructor key (see `_FormulaMeta`) to the canonical
+# node built for that key.
+_INTERN_TABLE = None
+
+
+class _FormulaMeta(type):
+    """Metaclass for formulae that implements the optional hash-consing mode.
+
+    When interning is enabled constructing a formula first looks up the node type
+    and the identities of its arguments in a weak-referenced table, and returns the
+    existing node if there is one.  Nodes hold strong references to their children
+    so the child identities in a live table entry can't be reused.  Keyword
+    arguments are bound to their positions and the arguments are normalized by
+    `_normalize_args`, so the key only refers to children the node keeps and the
+    same node is found however its arguments were passed.
+
+    """
+
+    def __call__(cls, *args, **kwargs):
+        if _INTERN_TABLE is None:
+            return super().__call__(*args, **kwargs)
+
+        if kwargs:
+            bound = inspect.signature(cls.__init__).bind(None, *args, **kwargs)
+            args = bound.args[1:]
+        args = cls._normalize_args(args)
+        key = (cls,) + tuple(id(a) if isinstance(a, Formula) else a for a in args)
+        node = _INTERN_TABLE.get(key)
+        if node is None:
+            node = super().__call__(*args)
+            _INTERN_TABLE[key] = node
+        return node
+
+
+def set_interning(enabled):
+    """Enables or disables hash-consing of newly constructed formulae.  Returns
+    whether interning was enabled before the call.
+
+    Interned formulae that are structurally identical (including variable names)
+    are the same Python object:
+
+    >>> was_enabled = set_interning(True)
+    >>> Succ(Var("x")) is Succ(Var("x"))
+    True
+    >>> _ = set_interning(was_enabled)
+    >>> Succ(Var("x")) is Succ(Var("x"))
+    False
+    """
+
+    global _INTERN_TABLE
+    was_enabled = _INTERN_TABLE is not None
+    if enabled and not was_enabled:
+        _INTERN_TABLE = weakref.WeakValueDictionary()
+    elif not enabled:
+        _INTERN_TABLE = None
+    return was_enabled
+
+
+@contextlib.contextmanager
+def interning():
+    """Context manager that enables interning for the duration of the block."""
+
+    was_enabled = set_interning(True)
+    try:
+        yield
+    finally:
+        set_interning(was_enabled)
+
+
+def get_intern_table_size():
+    """Returns the number of live interned formulae, or 0 if interning is off."""
+
+    return 0 if _INTERN_TABLE is None else len(_INTERN_TABLE)
+
+
+class _StructKey:
+    """Canonical representative of an alpha-equivalence class of formulae.
+
+    Keys are hash-consed in `_STRUCT_KEYS`, so two formulae are alpha-equivalent
+    iff their keys are the same object.
+
+    """
+
+    __slots__ = ("_children", "_lookup", "_fingerprint", "__weakref__")
+
+    def __init__(self, children, lookup):
+        # Keeps the child keys alive, which keeps their ids in `_STRUCT_KEYS` valid.
+        self._children = children
+        self._lookup = lookup
+        # A hash of the structure that, unlike the id-based hash of the key, is the
+        # same for keys that are freed and built again.  The ids of the children at
+        # the end of `lookup` are replaced by their fingerprints.
+        prefix = lookup[: len(lookup) - len(children)]
+        self._fingerprint = hash(prefix + tuple(c._fingerprint for c in children))
+
+    def __del__(self):
+        # `_STRUCT_KEYS` holds plain weak references, which are much cheaper than a
+        # `WeakValueDictionary`, so dead keys remove their own entry.
+        ref = _STRUCT_KEYS.get(self._lookup)
+        if ref is not None and ref() in (self, None):
+            del _STRUCT_KEYS[self._lookup]
+
+
+# Maps (tag, child key ids or atom) to a weak reference to the canonical key.
+_STRUCT_KEYS = {}
+
+
+def _intern_struct_key(lookup, children):
+    ref = _STRUCT_KEYS.get(lookup)
+    if ref is not None:
+        key = ref()
+        if key is not None:
+            return key
+    key = _StructKey(children, lookup)
+    _STRUCT_KEYS[lookup] = weakref.ref(key)
+    return key
+
+
+def _get_struct_key(tag, *children):
+    return _intern_struct_key((tag, *map(id, children)), children)
+
+
+def _get_atom_key(tag, atom):
+    return _intern_struct_key((tag, atom), ())
+
+
+def _get_succ_key(n, key):
+    """Returns the key of `n` applications of `Succ` to a formula with key `key`.
+
+    Runs of successors are keyed by their length so that a `Numeral` and the
+    equivalent chain of `Succ`s get the same key in O(1).
+
+    """
+
+    if key._lookup[0] is Succ:
+        n = n + key._lookup[1]
+        key = key._children[0]
+    return _intern_struct_key((Succ, n, id(key)), (key,))
+
+
+# Attributes set by `Formula._init_metadata`.
+_FORMULA_METADATA = frozenset(
+    ["_free_vars", "_bound_vars", "_size", "_depth", "_key", "_hash"]
+)
+
+
+class Formula(metaclass=_FormulaMeta):
+    """Base class for all formula sub-classes.
+
+    Every formula carries a de Bruijn-style structural key computed on
+    construction: variables bound by an enclosing `ForAll` are keyed by binder
+    depth and free variables by name.  Alpha-equivalent formulae have the same key
+    and equality is a key comparison:
+
+    >>> ForAll("x", Eq(Var("x"), Var("y"))) == ForAll("z", Eq(Var("z"), Var("y")))
+    True
+    >>> ForAll("x", Eq(Var("x"), Var("y"))) == ForAll("x", Eq(Var("x"), Var("x")))
+    False
+    """
+
+    @classmethod
+    def _normalize_args(cls, args):
+        # Returns constructor arguments equivalent to `args` that the node keeps as
+        # they are.  Only used when interning.
+        return args
+
+    def _init_metadata(self):
+        # Formulae are immutable so everything here is computed once, from the
+        # metadata already cached on the children.
+        self._free_vars = self._compute_free_vars()
+        self._bound_vars = self._compute_bound_vars()
+        self._size, self._depth = self._compute_size_and_depth()
+        self._key = self._compute_key()
+        self._hash = hash(self._key)
+
+    def __getstate__(self):
+        # Structural keys only mean something in the process that created them, so
+        # pickles and copies leave out the metadata and recompute it.
+        return {
+            name: value
+            for name, value in self.__dict__.items()
+            if name not in _FORMULA_METADATA
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_metadata()
+
+    def _compute_bound_vars(self):
+        bound_vars = frozenset()
+        for child in self._children():
+            if child._bound_vars:
+                bound_vars = bound_vars | child._bound_vars
+        return bound_vars
+
+    def _compute_size_and_depth(self):
+        size = 1
+        depth = 0
+        for child in self._children():
+            size = size + child._size
+            depth = max(depth, child._depth)
+        return size, depth + 1
+
+    def _key_from_children(self, child_keys):
+        return _get_struct_key(type(self), *child_keys)
 
     def __eq__(self, other):
-        if hash(self) != hash(other):
-            # This is a performance optimization; not needed for correct behavior.
-            return False
+        if self is other:
+            # Always true for structurally identical interned formulae.
+            return True
 
-        # Equality is just matching without any special treatment of free variables.
-        return _match_free_vars(
-            self,
-            other,
-            var_replacements={},
-            vars_to_capture=set(),
-            b_bindings_stack=[],
-            captured_formulae={},
-        )
+        return isinstance(other, Formula) and self._key is other._key
 
     def __hash__(self):
         # We construct and store _hash on construction.
         return self._hash
 
+    def __str__(self):
+        # Sub-classes describe their syntax as a list of strings and subformulae in
+        # `_str_parts`; expanding it with an explicit stack keeps printing deep
+        # formulae from overflowing the Python stack.
+        out = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                out.append(item)
+            else:
+                stack.extend(item._str_parts()[::-1])
+        return "".join(out)
+
+
+def _union_free_vars(a, b):
+    if a._free_vars is b._free_vars or not b._free_vars:
+        return a._free_vars
+    if not a._free_vars:
+        return b._free_vars
+    return a._free_vars | b._free_vars
+
+
+class _BoundVar:
+    """Tag for the structural key of a bound variable."""
+
+    pass
+
+
+def _get_bound_key(f, bindings, depth):
+    """Returns the structural key of `f` assuming it is nested in `depth` binders,
+    where `bindings` maps each bound variable name to the depth of its binder.
+
+    Subformulae that mention none of the variables in `bindings` reuse their
+    cached key, so only the paths leading to bound occurrences are walked.
+
+    """
+
+    def enter(node, ctx):
+        bindings, depth = ctx
+        if node._free_vars.isdisjoint(bindings):
+            return True, node._key
+
+        ntype = type(node)
+        if ntype == Var:
+            return True, _get_atom_key(_BoundVar, depth - 1 - bindings[node.name])
+        elif ntype == ForAll:
+            bindings = bindings.copy()
+            bindings[node.var] = depth
+            return False, (bindings, depth + 1)
+        return False, ctx
+
+    def leave(node, ctx, child_keys):
+        return node._key_from_children(child_keys)
+
+    return _fold(f, leave, enter, (bindings, depth))
+
 
 class Nat(Formula):
     """Base class for all formulae that represent natural numbers."""
@@ -40,13 +296,19 @@ class Zero(Nat):
     """Symbol for zero in Peano's axioms."""
 
     def __init__(self):
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
-        return "0"
+    def _str_parts(self):
+        return ["0"]
+
+    def _children(self):
+        return ()
+
+    def _compute_free_vars(self):
+        return frozenset()
 
-    def _compute_hash(self):
-        return hash((Zero,))
+    def _compute_key(self):
+        return _get_struct_key(Zero)
 
 
 class Succ(Nat):
@@ -57,19 +319,121 @@ class Succ(Nat):
         _assert_type(x, Nat)
 
         self._x = x
-        self._hash = self._compute_hash()
+        # Number of nested `Succ`s starting at this node.
+        self._run_length = x._run_length + 1 if isinstance(x, Succ) else 1
+        self._init_metadata()
 
-    def __str__(self):
-        return f"S({self.x})"
+    def _str_parts(self):
+        return ["S(", self.x, ")"]
+
+    def _children(self):
+        return (self.x,)
+
+    def _compute_free_vars(self):
+        return self.x._free_vars
+
+    def _compute_key(self):
+        return self._key_from_children((self.x._key,))
 
-    def _compute_hash(self):
-        return hash((Succ, self.x))
+    def _key_from_children(self, child_keys):
+        return _get_succ_key(1, child_keys[0])
 
     @property
     def x(self):
         return self._x
 
 
+class Numeral(Succ):
+    """Run-length representation of `n` applications of `Succ` to `base`.
+
+    A `Numeral` behaves exactly like the equivalent chain of `Succ`s but takes
+    constant space, so large concrete numbers are cheap to build and compare:
+
+    >>> print(Numeral(3))
+    S(S(S(0)))
+    >>> Numeral(3) == Succ(Succ(Succ(Zero())))
+    True
+    >>> print(Numeral(2, Var("x")).x)
+    S(x)
+    """
+
+    @classmethod
+    def _normalize_args(cls, args):
+        # The default base is `Zero()`, and `__init__` doesn't keep a `Succ` base,
+        # so peel it here.
+        if len(args) == 1 or (len(args) == 2 and args[1] is None):
+            args = (args[0], Zero())
+        if len(args) == 2 and isinstance(args[0], int) and isinstance(args[1], Succ):
+            n, base = args
+            return (n + base._run_length, _peel_succ(base, base._run_length))
+        return args
+
+    def __init__(self, n, base=None):
+        if base is None:
+            base = Zero()
+        _assert_type(n, int)
+        _assert_type(base, Nat)
+        assert n >= 1, f"Expected n >= 1, found {n}"
+
+        # Keep `base` from being a `Succ` so that runs are always maximal.
+        if isinstance(base, Succ):
+            n = n + base._run_length
+            base = _peel_succ(base, base._run_length)
+
+        self._n = n
+        self._base = base
+        self._run_length = n
+        self._init_metadata()
+
+    def _str_parts(self):
+        return ["S(" * self.n, self.base, ")" * self.n]
+
+    def _children(self):
+        return (self.base,)
+
+    def _compute_free_vars(self):
+        return self.base._free_vars
+
+    def _compute_size_and_depth(self):
+        # Same as the equivalent chain of `Succ`s.
+        return self.n + self.base._size, self.n + self.base._depth
+
+    def _compute_key(self):
+        return self._key_from_children((self.base._key,))
+
+    def _key_from_children(self, child_keys):
+        return _get_succ_key(self.n, child_keys[0])
+
+    @property
+    def n(self):
+        return self._n
+
+    @property
+    def base(self):
+        return self._base
+
+    @property
+    def x(self):
+        # Peels one `Succ` on demand.
+        return _peel_succ(self, 1)
+
+
+def _peel_succ(f, k):
+    """Strips `k` applications of `Succ` off `f`."""
+
+    while k > 0:
+        if type(f) == Numeral:
+            if k < f.n:
+                return Numeral(f.n - k, f.base)
+            k = k - f.n
+            f = f.base
+        else:
+            _assert_type(f, Succ)
+            k = k - 1
+            f = f.x
+    return f
+
+
 class Add(Nat):
     def __init__(self, a: Nat, b: Nat):
         _assert_type(a, Nat)
@@ -78,13 +442,19 @@ class Add(Nat):
         self._a = a
         self._b = b
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
-        return f"({self.a} + {self.b})"
+    def _str_parts(self):
+        return ["(", self.a, " + ", self.b, ")"]
+
+    def _children(self):
+        return (self.a, self.b)
+
+    def _compute_free_vars(self):
+        return _union_free_vars(self.a, self.b)
 
-    def _compute_hash(self):
-        return hash((Add, self.a, self.b))
+    def _compute_key(self):
+        return _get_struct_key(Add, self.a._key, self.b._key)
 
     @property
     def a(self):
@@ -103,13 +473,19 @@ class Mul(Nat):
         self._a = a
         self._b = b
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
-        return f"({self.a} * {self.b})"
+    def _str_parts(self):
+        return ["(", self.a, " * ", self.b, ")"]
+
+    def _children(self):
+        return (self.a, self.b)
+
+    def _compute_free_vars(self):
+        return _union_free_vars(self.a, self.b)
 
-    def _compute_hash(self):
-        return hash((Mul, self.a, self.b))
+    def _compute_key(self):
+        return _get_struct_key(Mul, self.a._key, self.b._key)
 
     @property
     def a(self):
@@ -133,15 +509,21 @@ class Var(Nat):
 
         self._name = name
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
-        return self.name
+    def _str_parts(self):
+        return [self.name]
+
+    def _children(self):
+        return ()
 
-    def _compute_hash(self):
-        # Don't include the name in the hash; if we do then alpha-equivalent forall
-        # expressions will have different hashes.
-        return hash((Var,))
+    def _compute_free_vars(self):
+        return frozenset([self.name])
+
+    def _compute_key(self):
+        # A variable on its own is free.  `ForAll` recomputes the key of its body so
+        # that the variables it binds are keyed by binder depth instead of by name.
+        return _get_atom_key(Var, self.name)
 
     @property
     def name(self):
@@ -162,13 +544,19 @@ class Eq(Pred):
         self._a = a
         self._b = b
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
-        return f"({self.a} = {self.b})"
+    def _str_parts(self):
+        return ["(", self.a, " = ", self.b, ")"]
 
-    def _compute_hash(self):
-        return hash((Eq, self.a, self.b))
+    def _children(self):
+        return (self.a, self.b)
+
+    def _compute_free_vars(self):
+        return _union_free_vars(self.a, self.b)
+
+    def _compute_key(self):
+        return _get_struct_key(Eq, self.a._key, self.b._key)
 
     @property
     def a(self):
@@ -187,13 +575,19 @@ class And(Pred):
         self._a = a
         self._b = b
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
-        return f"({self.a} & {self.b})"
+    def _str_parts(self):
+        return ["(", self.a, " & ", self.b, ")"]
 
-    def _compute_hash(self):
-        return hash((And, self.a, self.b))
+    def _children(self):
+        return (self.a, self.b)
+
+    def _compute_free_vars(self):
+        return _union_free_vars(self.a, self.b)
+
+    def _compute_key(self):
+        return _get_struct_key(And, self.a._key, self.b._key)
 
     @property
     def a(self):
@@ -210,15 +604,21 @@ class Not(Pred):
 
         self._x = x
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
+    def _str_parts(self):
         if isinstance(self.x, ForAll) and isinstance(self.x.body, Not):
-            return f"(exists {self.x.var}. {self.x.body.x})"
-        return f"!{self.x}"
+            return [f"(exists {self.x.var}. ", self.x.body.x, ")"]
+        return ["!", self.x]
+
+    def _children(self):
+        return (self.x,)
 
-    def _compute_hash(self):
-        return hash((Not, self.x))
+    def _compute_free_vars(self):
+        return self.x._free_vars
+
+    def _compute_key(self):
+        return _get_struct_key(Not, self.x._key)
 
     @property
     def x(self):
@@ -233,16 +633,22 @@ class Implies(Pred):
         self._p = p
         self._q = q
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
+    def _str_parts(self):
         if isinstance(self.p, Implies):
-            return f"({self.p}) => {self.q}"
+            return ["(", self.p, ") => ", self.q]
         else:
-            return f"{self.p} => {self.q}"
+            return [self.p, " => ", self.q]
+
+    def _children(self):
+        return (self.p, self.q)
 
-    def _compute_hash(self):
-        return hash((Implies, self.p, self.q))
+    def _compute_free_vars(self):
+        return _union_free_vars(self.p, self.q)
+
+    def _compute_key(self):
+        return _get_struct_key(Implies, self.p._key, self.q._key)
 
     @property
     def p(self):
@@ -261,18 +667,27 @@ class ForAll(Pred):
         self._var = var
         self._body = body
 
-        self._hash = self._compute_hash()
+        self._init_metadata()
 
-    def __str__(self):
+    def _str_parts(self):
         varlist = []
         i = self
         while isinstance(i, ForAll):
             varlist.append(i.var)
             i = i.body
-        return f"(forall {', '.join(varlist)}. {i})"
+        return [f"(forall {', '.join(varlist)}. ", i, ")"]
+
+    def _children(self):
+        return (self.body,)
+
+    def _compute_free_vars(self):
+        return self.body._free_vars - {self.var}
 
-    def _compute_hash(self):
-        return hash((ForAll, self.body))
+    def _compute_bound_vars(self):
+        return self.body._bound_vars | {self.var}
+
+    def _compute_key(self):
+        return _get_struct_key(ForAll, _get_bound_key(self.body, {self.var: 0}, 1))
 
     @property
     def var(self):
@@ -283,20 +698,89 @@ class ForAll(Pred):
         return self._body
 
 
-def _recursively_get_all_subformulae(f):
-    yield f
+# Returned by the `enter` callback of `_walk` to skip the children of a node.
+_SKIP_CHILDREN = object()
+
+
+def _walk(f, enter=None, ctx=None):
+    """Yields `(node, ctx)` for every subformula of `f` in pre-order.
+
+    This is the traversal engine the formula utilities are built on; it uses an
+    explicit stack so that arbitrarily deep formulae can be walked.  If `enter` is
+    given, `enter(node, ctx)` returns the context to visit the children of `node`
+    with, or `_SKIP_CHILDREN` to not visit them.
+
+    """
+
+    stack = [(f, ctx)]
+    while stack:
+        node, ctx = stack.pop()
+        yield node, ctx
+
+        if enter is not None:
+            ctx = enter(node, ctx)
+            if ctx is _SKIP_CHILDREN:
+                continue
+
+        children = node._children()
+        for child in reversed(children):
+            stack.append((child, ctx))
+
 
+def _fold(f, leave, enter=None, ctx=None):
+    """Computes a value for `f` bottom-up with an explicit stack.
+
+    `leave(node, ctx, child_values)` combines the values computed for the children
+    of `node`, where `ctx` is the context the children were visited with.  If
+    `enter` is given, `enter(node, ctx)` is called top-down and returns either
+    `(True, value)` to use `value` for `node` without visiting its children, or
+    `(False, child_ctx)` to visit them with context `child_ctx`.
+
+    """
+
+    values = []
+    # Entries are (node, ctx, num_children); num_children is -1 until `node` has been
+    # entered and its children pushed.
+    stack = [(f, ctx, -1)]
+    while stack:
+        node, ctx, num_children = stack.pop()
+        if num_children >= 0:
+            if num_children == 0:
+                child_values = ()
+            else:
+                child_values = values[-num_children:]
+                del values[-num_children:]
+            values.append(leave(node, ctx, child_values))
+            continue
+
+        if enter is not None:
+            done, ctx = enter(node, ctx)
+            if done:
+                values.append(ctx)
+                continue
+
+        children = node._children()
+        stack.append((node, ctx, len(children)))
+        for child in reversed(children):
+            stack.append((child, ctx, -1))
+
+    return values[0]
+
+
+def _rebuild(f, children):
+    """Returns a formula like `f` but with `children` as its subformulae.  Returns `f`
+    itself if the children are unchanged, so untouched subtrees stay shared.
+
+    """
+
+    if all(new is old for new, old in zip(children, f._children())):
+        return f
     ftype = type(f)
-    if ftype == Succ or ftype == Not:
-        yield from _recursively_get_all_subformulae(f.x)
-    elif ftype == Add or ftype == Eq or ftype == And:
-        yield from _recursively_get_all_subformulae(f.a)
-        yield from _recursively_get_all_subformulae(f.b)
-    elif ftype == Implies:
-        yield from _recursively_get_all_subformulae(f.p)
-        yield from _recursively_get_all_subformulae(f.q)
-    elif ftype == ForAll:
-        yield from _recursively_get_all_subformulae(f.body)
+    if ftype == ForAll:
+        return ForAll(f.var, children[0])
+    elif ftype == Numeral:
+        return Numeral(f.n, children[0])
+    return ftype(*children)
 
 
 def get_all_subformulae(f):
@@ -307,88 +791,274 @@ def get_all_subformulae(f):
     (forall x. (x = x)), (x = x), x, x
     """
 
-    yield from _recursively_get_all_subformulae(f)
-
-
-def _match_free_vars(
-    a, b, var_replacements, vars_to_capture, b_bindings_stack, captured_formulae
-):
-    def recurse(aa, bb):
-        return _match_free_vars(
-            aa,
-            bb,
-            var_replacements,
-            vars_to_capture,
-            b_bindings_stack,
-            captured_formulae,
-        )
-
-    atype = type(a)
-
-    if atype == Var and a.name in vars_to_capture:
-        if a.name in captured_formulae:
-            return captured_formulae[a.name] == b
-        for subb in get_all_subformulae(b):
-            if isinstance(subb, Var) and subb.name in b_bindings_stack:
+    for node, _ in _walk(f):
+        yield node
+        if type(node) == Numeral:
+            # Numerals only store their base as a child, but contain every shorter run
+            # of successors as a subformula too.
+            for k in range(node.n - 1, 0, -1):
+                yield Numeral(k, node.base)
+
+
+def _match_free_vars(a, b, vars_to_capture, captured_formulae):
+    # Each stack entry pairs up subformulae of `a` and `b` with the variables bound on
+    # each side, mapped to the depth of their binder, and the number of binders
+    # entered so far.  A bound variable matches only the variable bound at the same
+    # depth on the other side, and a free variable only the same free variable.
+    stack = [(a, b, {}, {}, 0, vars_to_capture)]
+    while stack:
+        a, b, a_bindings, b_bindings, depth, vars_to_capture = stack.pop()
+        atype = type(a)
+
+        if atype == Var and a.name in vars_to_capture:
+            # A capture can't refer to variables bound in `b` since they would escape
+            # their scope.
+            if not b._free_vars.isdisjoint(b_bindings):
                 return False
-        captured_formulae[a.name] = b
-        return True
-
-    if atype != type(b):
-        return False
-
-    if atype == Var:
-        b_name = var_replacements.get(b.name, b.name)
-        return a.name == b_name
-    elif atype == Zero:
-        return True
-    elif atype == Succ or atype == Not:
-        return recurse(a.x, b.x)
-    elif atype == Add or atype == Mul or atype == Eq or atype == And:
-        return recurse(a.a, b.a) and recurse(a.b, b.b)
-    elif atype == Implies:
-        return recurse(a.p, b.p) and recurse(a.q, b.q)
-    elif atype == ForAll:
-        if a.var != b.var:
-            var_replacements = var_replacements.copy()
-            var_replacements[b.var] = a.var
-        if a.var in vars_to_capture:
-            vars_to_capture = vars_to_capture.copy()
-            vars_to_capture.remove(a.var)
-        b_bindings_stack = b_bindings_stack.copy()
-        b_bindings_stack.append(b.var)
-        return _match_free_vars(
-            a.body,
-            b.body,
-            var_replacements,
-            vars_to_capture,
-            b_bindings_stack,
-            captured_formulae,
-        )
-
-    assert False, f"Unhandled type: {atype}"
-
-
-def _recursively_subst_vars(f, var_assignment):
-    def recurse(subexpr):
-        return _recursively_subst_vars(subexpr, var_assignment)
+            if a.name in captured_formulae:
+                if captured_formulae[a.name] != b:
+                    return False
+            else:
+                captured_formulae[a.name] = b
+            continue
+
+        if (
+            isinstance(a, Succ)
+            and isinstance(b, Succ)
+            and (atype == Numeral or type(b) == Numeral)
+        ):
+            # Peel the common run of successors in one step.
+            k = min(a._run_length, b._run_length)
+            stack.append(
+                (
+                    _peel_succ(a, k),
+                    _peel_succ(b, k),
+                    a_bindings,
+                    b_bindings,
+                    depth,
+                    vars_to_capture,
+                )
+            )
+            continue
+
+        if atype != type(b):
+            return False
 
-    ftype = type(f)
-    if ftype == Var and f.name in var_assignment:
-        return var_assignment[f.name]
-    elif ftype == Succ or ftype == Not:
-        return ftype(recurse(f.x))
-    elif ftype == Add or ftype == Mul or ftype == Eq or ftype == And:
-        return ftype(recurse(f.a), recurse(f.b))
-    elif ftype == Implies:
-        return Implies(recurse(f.p), recurse(f.q))
-    elif ftype == ForAll:
-        if f.var in var_assignment:
+        if a._free_vars.isdisjoint(vars_to_capture):
+            # Nothing to capture in `a` so it has to match `b` exactly.
+            if a._size != b._size:
+                return False
+            if a._free_vars.isdisjoint(a_bindings) and b._free_vars.isdisjoint(
+                b_bindings
+            ):
+                # Neither side refers to an enclosing binder so the structural keys
+                # decide.
+                if a._key is not b._key:
+                    return False
+                continue
+
+        if atype == Var:
+            a_depth = a_bindings.get(a.name)
+            b_depth = b_bindings.get(b.name)
+            if a_depth is None and b_depth is None:
+                if a.name != b.name:
+                    return False
+            elif a_depth != b_depth:
+                return False
+        elif atype == ForAll:
+            a_bindings = a_bindings.copy()
+            a_bindings[a.var] = depth
+            b_bindings = b_bindings.copy()
+            b_bindings[b.var] = depth
+            if a.var in vars_to_capture:
+                vars_to_capture = vars_to_capture.copy()
+                vars_to_capture.remove(a.var)
+            stack.append(
+                (a.body, b.body, a_bindings, b_bindings, depth + 1, vars_to_capture)
+            )
+        else:
+            a_children = a._children()
+            b_children = b._children()
+            for i in range(len(a_children) - 1, -1, -1):
+                stack.append(
+                    (
+                        a_children[i],
+                        b_children[i],
+                        a_bindings,
+                        b_bindings,
+                        depth,
+                        vars_to_capture,
+                    )
+                )
+
+    return True
+
+
+# Instructions of the matching programs built by `compile_template`.  Each one
+# checks the next subformula of the matched formula against a subformula of the
+# template:
+#
+#   _MATCH_KEY      a subformula without captures or bound variables, by key
+#   _MATCH_CAPTURE  a variable to capture, by name
+#   _MATCH_BOUND    a variable bound by the enclosing binder at the given depth
+#   _MATCH_SUCC     the given number of successors, followed by the base
+#   _MATCH_FORALL   a binder at the given depth, followed by its body
+#   _MATCH_NODE     any other node, by type and size (None if the subtree has
+#                   captures), followed by its children
+_MATCH_KEY = 0
+_MATCH_CAPTURE = 1
+_MATCH_BOUND = 2
+_MATCH_SUCC = 3
+_MATCH_FORALL = 4
+_MATCH_NODE = 5
+
+# Maps the keys of recently matched templates and the variables they capture to
+# their matching programs.  Templates `match_template` has only seen once map to
+# None: compiling a template costs more than matching it once, so it is only
+# compiled when it is seen again.
+_COMPILED_TEMPLATES = lru.LRUCache(1024)
+
+
+def _get_match_program(template, vars_to_capture, compile_now):
+    # `vars_to_capture` must be a subset of the free variables of `template`.
+    cache_key = (template._key, vars_to_capture)
+    if cache_key in _COMPILED_TEMPLATES:
+        compile_now = True
+    program = _COMPILED_TEMPLATES.get(cache_key)
+    if program is None and compile_now:
+        program = _compile_match_program(template, vars_to_capture)
+    _COMPILED_TEMPLATES[cache_key] = program
+    return program
+
+
+def _compile_match_program(template, vars_to_capture):
+    # The instructions are listed in the order the template is walked, depth-first
+    # from left to right, which is the order `_run_match_program` pops the
+    # corresponding subformulae of the matched formula off its stack.
+    program = []
+    stack = [(template, {}, 0, vars_to_capture)]
+    while stack:
+        a, a_bindings, depth, vars_to_capture = stack.pop()
+        atype = type(a)
+        if atype == Var and a.name in vars_to_capture:
+            program.append((_MATCH_CAPTURE, a.name))
+        elif a._free_vars.isdisjoint(vars_to_capture) and a._free_vars.isdisjoint(
+            a_bindings
+        ):
+            program.append((_MATCH_KEY, a._key))
+        elif atype == Var:
+            program.append((_MATCH_BOUND, a_bindings[a.name]))
+        elif isinstance(a, Succ):
+            k = a._run_length
+            program.append((_MATCH_SUCC, k))
+            stack.append((_peel_succ(a, k), a_bindings, depth, vars_to_capture))
+        elif atype == ForAll:
+            program.append((_MATCH_FORALL, depth))
+            a_bindings = a_bindings.copy()
+            a_bindings[a.var] = depth
+            if a.var in vars_to_capture:
+                vars_to_capture = vars_to_capture - {a.var}
+            stack.append((a.body, a_bindings, depth + 1, vars_to_capture))
+        else:
+            size = a._size if a._free_vars.isdisjoint(vars_to_capture) else None
+            program.append((_MATCH_NODE, (atype, size)))
+            for child in reversed(a._children()):
+                stack.append((child, a_bindings, depth, vars_to_capture))
+    return program
+
+
+def _run_match_program(program, f, captured_formulae):
+    # Has the same semantics as `_match_free_vars`, with the template already
+    # broken down into instructions.  Each stack entry is a subformula of `f` with
+    # the variables bound around it, mapped to the depth of their binder.
+    stack = [(f, {})]
+    for op, arg in program:
+        b, b_bindings = stack.pop()
+        if op == _MATCH_KEY:
+            if b._key is not arg or not b._free_vars.isdisjoint(b_bindings):
+                return False
+        elif op == _MATCH_NODE:
+            btype, size = arg
+            if type(b) != btype or (size is not None and b._size != size):
+                return False
+            children = b._children()
+            for i in range(len(children) - 1, -1, -1):
+                stack.append((children[i], b_bindings))
+        elif op == _MATCH_CAPTURE:
+            # A capture can't refer to variables bound in `f` since they would
+            # escape their scope.
+            if not b._free_vars.isdisjoint(b_bindings):
+                return False
+            captured = captured_formulae.get(arg)
+            if captured is None:
+                captured_formulae[arg] = b
+            elif captured != b:
+                return False
+        elif op == _MATCH_BOUND:
+            if type(b) != Var or b_bindings.get(b.name) != arg:
+                return False
+        elif op == _MATCH_SUCC:
+            if not isinstance(b, Succ) or b._run_length < arg:
+                return False
+            stack.append((_peel_succ(b, arg), b_bindings))
+        else:
+            if type(b) != ForAll:
+                return False
+            b_bindings = b_bindings.copy()
+            b_bindings[b.var] = arg
+            stack.append((b.body, b_bindings))
+    return True
+
+
+def compile_template(template, vars_to_capture):
+    """Returns a function `match(f, captured_formulae=None)` that is equivalent to
+    `match_template(template, f, vars_to_capture, captured_formulae)`, including
+    rejecting repeated captures that a binder in `f` would capture.
+
+    The template is analyzed once, so matching many formulae against the same
+    template is faster than interpreting it each time.  Compiled templates are
+    cached, keyed by the template up to alpha-equivalence.
+
+    >>> match = compile_template(Add(Var("x"), Succ(Var("y"))), ["x", "y"])
+    >>> captures = {}
+    >>> match(Add(Zero(), Succ(Succ(Zero()))), captures)
+    True
+    >>> print(captures["y"])
+    S(0)
+    >>> match(Mul(Zero(), Succ(Zero())))
+    False
+
+    """
+
+    vars_to_capture = template._free_vars.intersection(vars_to_capture)
+    program = _get_match_program(template, vars_to_capture, True)
+
+    def match(f, captured_formulae=None):
+        if captured_formulae is None:
+            captured_formulae = {}
+        return _run_match_program(program, f, captured_formulae)
+
+    return match
+
+
+def _subst_vars(f, var_assignment):
+    def enter(node, var_assignment):
+        if node._free_vars.isdisjoint(var_assignment):
+            # Nothing to substitute, reuse the subtree as-is.
+            return True, node
+
+        ntype = type(node)
+        if ntype == Var:
+            return True, var_assignment.get(node.name, node)
+        elif ntype == ForAll and node.var in var_assignment:
             var_assignment = var_assignment.copy()
-            del var_assignment[f.var]
-        return ForAll(f.var, _recursively_subst_vars(f.body, var_assignment))
-    else:
-        return f
+            del var_assignment[node.var]
+        return False, var_assignment
+
+    def leave(node, var_assignment, children):
+        return _rebuild(node, children)
+
+    return _fold(f, leave, enter, var_assignment)
 
 
 def substitute_forall(f, value):
@@ -401,7 +1071,31 @@ def substitute_forall(f, value):
     """
 
     _assert_type(f, ForAll)
-    return _recursively_subst_vars(f.body, {f.var: value})
+    return _subst_vars(f.body, {f.var: value})
+
+
+def substitute_foralls(f, values):
+    """Instantiates the outermost `len(values)` quantifiers of `f` with `values` in a
+    single pass.
+
+    >>> f = ForAll("x", ForAll("y", Eq(Var("x"), Var("y"))))
+    >>> print(substitute_foralls(f, [Zero(), Succ(Zero())]))
+    (0 = S(0))
+
+    The substitution is simultaneous, so unlike repeated calls to
+    `substitute_forall` a value is never substituted into by a later one:
+
+    >>> print(substitute_foralls(f, [Var("y"), Zero()]))
+    (y = 0)
+    """
+
+    var_assignment = {}
+    for value in values:
+        _assert_type(f, ForAll)
+        # An inner quantifier over the same variable shadows the outer one.
+        var_assignment[f.var] = value
+        f = f.body
+    return _subst_vars(f, var_assignment)
 
 
 def substitute_free_var(f, free_var, value):
@@ -417,7 +1111,7 @@ def substitute_free_var(f, free_var, value):
     >>> print(newf)
     (forall x. (x = x))
     """
-    return _recursively_subst_vars(f, {free_var: value})
+    return _subst_vars(f, {free_var: value})
 
 
 def get_name_generator(fs):
@@ -463,39 +1157,70 @@ def get_name_generator(fs):
     return generate
 
 
-def _recursively_get_free_vars(f, env, result):
-    def recurse(subf):
-        _recursively_get_free_vars(subf, env, result)
+def get_free_vars(f):
+    """Returns the set of free variables in `f`.
+
+    >>> sorted(get_free_vars(ForAll("x", Eq(Var("x"), Var("y")))))
+    ['y']
 
-    ftype = type(f)
-    if ftype == Zero:
-        pass
-    elif ftype == Var:
-        if f.name not in env:
-            result.add(f.name)
-    elif ftype == Succ or ftype == Not:
-        return recurse(f.x)
-    elif ftype == Add or ftype == Mul or ftype == Eq or ftype == And:
-        recurse(f.a)
-        recurse(f.b)
-    elif ftype == Implies:
-        recurse(f.p)
-        recurse(f.q)
-    else:
-        assert ftype == ForAll, f"ftype = {ftype}"
-        _recursively_get_free_vars(f.body, env + [f.var], result)
+    Every formula caches its free variables on construction, so this is O(1) and
+    returns an immutable `frozenset`.
+    """
 
+    return f._free_vars
 
-def get_free_vars(f):
-    """Returns the set of free variables in `f`.
 
-    >>> get_free_vars(ForAll("x", Eq(Var("x"), Var("y"))))
-    {'y'}
+def get_bound_vars(f):
+    """Returns the (immutable) set of variables bound by some `ForAll` in `f`.
+
+    >>> f = And(ForAll("x", Eq(Var("x"), Zero())), ForAll("y", Eq(Var("y"), Var("z"))))
+    >>> sorted(get_bound_vars(f))
+    ['x', 'y']
     """
 
-    result = set()
-    _recursively_get_free_vars(f, [], result)
-    return result
+    return f._bound_vars
+
+
+def contains_forall(f):
+    """Returns True iff `f` has a `ForAll` subformula."""
+
+    return len(f._bound_vars) != 0
+
+
+def get_size(f):
+    """Returns the number of nodes in `f`, counting a `Numeral` like the equivalent
+    chain of `Succ`s.
+
+    >>> get_size(ForAll("x", Eq(Var("x"), Succ(Zero()))))
+    5
+    """
+
+    return f._size
+
+
+def get_depth(f):
+    """Returns the length of the longest path from `f` to a leaf, counting nodes.
+
+    >>> get_depth(ForAll("x", Eq(Var("x"), Succ(Zero()))))
+    4
+    """
+
+    return f._depth
+
+
+def get_fingerprint(f):
+    """Returns a hash of `f` that is the same for alpha-equivalent formulae and,
+    unlike `hash(f)`, doesn't change when `f` is freed and built again, e.g. by
+    parsing it a second time.
+
+    >>> f = ForAll("x", Eq(Var("x"), Zero()))
+    >>> get_fingerprint(f) == get_fingerprint(ForAll("y", Eq(Var("y"), Zero())))
+    True
+
+    Different formulae may have the same fingerprint.
+    """
+
+    return f._key._fingerprint
 
 
 def replace_subformula(f, x, y):
@@ -517,57 +1242,44 @@ def replace_subformula(f, x, y):
 
     """
 
-    def recurse(subf):
-        return replace_subformula(subf, x, y)
-
-    if f == x:
-        if callable(y):
-            return y()
-        else:
-            return y
-
-    ftype = type(f)
-    if ftype == Var or ftype == Zero:
-        return f
-    elif ftype == Succ or ftype == Not:
-        return Succ(recurse(f.x))
-    elif ftype == Add or ftype == Mul or ftype == Eq or ftype == And:
-        return ftype(recurse(f.a), recurse(f.b))
-    elif ftype == Implies:
-        return Implies(recurse(f.p), recurse(f.q))
-    else:
-        assert ftype == ForAll, f"ftype = {ftype}"
-        return ForAll(f.var, recurse(f.body))
-
-
-def _recursively_canonicalize_bound_vars(f, bindings, vargen, free_vars):
-    def recurse(subf):
-        return _recursively_canonicalize_bound_vars(subf, bindings, vargen, free_vars)
-
-    ftype = type(f)
-    if ftype == Zero:
-        return f
-    elif ftype == Var:
-        if f.name in bindings:
-            return bindings[f.name]
-        free_vars.add(f)
-        return f
-    elif ftype == Succ or ftype == Not:
-        return ftype(recurse(f.x))
-    elif ftype == Add or ftype == Mul or ftype == Eq or ftype == And:
-        return ftype(recurse(f.a), recurse(f.b))
-    elif ftype == Implies:
-        return Implies(recurse(f.p), recurse(f.q))
-    else:
-        assert ftype == ForAll, f"ftype = {ftype}"
-        newvar = vargen()
-
-        bindings = bindings.copy()
-        bindings[f.var] = Var(newvar)
-
-        body = _recursively_canonicalize_bound_vars(f.body, bindings, vargen, free_vars)
-
-        return ForAll(newvar, body)
+    def replacement():
+        return y() if callable(y) else y
+
+    # Every subtree carries its alpha-invariant key, and keys are hash-consed, so a
+    # subtree is an instance of `x` exactly when its key is `x`'s key.  Subtrees
+    # smaller or shallower than `x` can't contain it and are skipped outright.
+    x_key = x._key
+    x_size = x._size
+    x_depth = x._depth
+    x_run_length = x._run_length if isinstance(x, Succ) else 0
+
+    # Subtrees shared by reference are only rewritten once, unless `y` has to be
+    # called afresh for each instance.
+    memo = None if callable(y) else {}
+
+    def enter(node, ctx):
+        if node._size < x_size or node._depth < x_depth:
+            return True, node
+        if node._key is x_key:
+            return True, replacement()
+        if memo is not None:
+            done = memo.get(id(node))
+            if done is not None:
+                return True, done
+        if x_run_length and type(node) == Numeral:
+            # `x` may be one of the shorter runs of successors inside `node`.
+            m = x_run_length
+            if m < node.n and _peel_succ(x, m)._key is node.base._key:
+                return True, Numeral(node.n - m, replacement())
+        return False, ctx
+
+    def leave(node, ctx, children):
+        result = _rebuild(node, children)
+        if memo is not None:
+            memo[id(node)] = result
+        return result
+
+    return _fold(f, leave, enter)
 
 
 def canonicalize_bound_vars(f, free_vars=None):
@@ -592,7 +1304,24 @@ def canonicalize_bound_vars(f, free_vars=None):
         var_counter = var_counter + 1
         return f"${x}"
 
-    return _recursively_canonicalize_bound_vars(f, {}, vargen, free_vars)
+    def enter(node, bindings):
+        ntype = type(node)
+        if ntype == Var:
+            if node.name in bindings:
+                return True, bindings[node.name]
+            free_vars.add(node)
+            return True, node
+        elif ntype == ForAll:
+            bindings = bindings.copy()
+            bindings[node.var] = Var(vargen())
+        return False, bindings
+
+    def leave(node, bindings, children):
+        if type(node) == ForAll:
+            return ForAll(bindings[node.var].name, children[0])
+        return _rebuild(node, children)
+
+    return _fold(f, leave, enter, {})
 
 
 def match_template(template, f, vars_to_capture, captured_formulae=None):
@@ -634,16 +1363,31 @@ def match_template(template, f, vars_to_capture, captured_formulae=None):
     >>> print(result)
     False
 
+    This holds for every occurrence of a captured variable, not just the first: a
+    repeated capture doesn't match a formula that a binder in `f` would capture,
+    even though `substitute_free_var` would produce `f` from it.
+
+    >>> template = And(Eq(Var("x"), Zero()), ForAll("y", Eq(Var("x"), Var("y"))))
+    >>> f = And(Eq(Var("y"), Zero()), ForAll("y", Eq(Var("y"), Var("y"))))
+    >>> result = match_template(template, f, ["x"])
+    >>> print(result)
+    False
+
     """
 
     if captured_formulae is None:
         captured_formulae = {}
 
+    # Templates matched repeatedly, like the lemmas a proof instantiates over and
+    # over, are compiled by `compile_template`.
+    vars_to_capture = template._free_vars.intersection(vars_to_capture)
+    program = _get_match_program(template, vars_to_capture, False)
+    if program is not None:
+        return _run_match_program(program, f, captured_formulae)
+
     return _match_free_vars(
         template,
         f,
-        var_replacements={},
         vars_to_capture=set(vars_to_capture),
-        b_bindings_stack=[],
         captured_formulae=captured_formulae,
     )
@@ -85,11 +85,10 @@ class _CachedVars:
             setattr(self, f"_s{v}", Succ(var))
             setattr(_CachedVars, f"s{v}", property(_make_getter(f"_s{v}")))
 
-        ivalue = Zero()
         for i in range(0, 20):
+            ivalue = Numeral(i) if i > 0 else Zero()
             setattr(self, f"_i{i}", ivalue)
             setattr(_CachedVars, f"i{i}", property(_make_getter(f"_i{i}")))
-            ivalue = Succ(ivalue)
 
     @property
     def Z(self):
@@ -1,6 +1,11 @@
 from formula import *
+from random_formulae_test import *
 
+import copy
+import formula
 import itertools as it
+import pickle
+import random
 
 
 def test_serialization_0():
@@ -364,7 +369,7 @@ def test_get_all_subformulae_complex():
         )
     )
     subformulae = list(get_all_subformulae(formula))
-    assert len(subformulae) == 14
+    assert len(subformulae) == 16
 
 
 def test_hash_consistency():
@@ -386,3 +391,304 @@ def test_canonicalize_with_free_vars():
     canonicalized = canonicalize_bound_vars(formula, free_vars)
     assert str(canonicalized) == "(forall $0. (($0 = free1) & (forall $1. ($1 = free2))))"
     assert len(free_vars) == 2
+
+
+def test_interning_shares_nodes():
+    with interning():
+        a = ForAll("x", Eq(Add(Var("x"), Succ(Zero())), Var("y")))
+        b = ForAll("x", Eq(Add(Var("x"), Succ(Zero())), Var("y")))
+        assert a is b
+        assert a.body.a.b is b.body.a.b
+        assert ForAll("z", Eq(Add(Var("z"), Succ(Zero())), Var("y"))) == a
+        assert get_intern_table_size() > 0
+
+    assert Succ(Zero()) is not Succ(Zero())
+    assert get_intern_table_size() == 0
+
+
+def test_interning_numerals_with_succ_base():
+    # `Numeral` peels a `Succ` base, so only the peeled base is kept alive and the
+    # original argument's id gets reused.
+    with interning():
+        variables = [Var(f"b{i}") for i in range(100)]
+        numerals = []
+        for i, v in enumerate(variables):
+            numerals.append(Numeral(1, Succ(v)))
+            assert str(numerals[-1]) == f"S(S(b{i}))"
+        assert numerals[-1] is Numeral(2, variables[-1])
+
+
+def test_interning_keyword_arguments():
+    x = Var("x")
+    for enabled in [False, True]:
+        was_enabled = set_interning(enabled)
+        try:
+            assert Numeral(2, base=x) == Numeral(2, x)
+            assert Eq(a=Zero(), b=x) == Eq(Zero(), x)
+            assert ForAll(var="x", body=Eq(x, x)) == ForAll("x", Eq(x, x))
+        finally:
+            set_interning(was_enabled)
+
+    with interning():
+        assert Numeral(2, base=x) is Numeral(2, x)
+        assert Eq(a=Zero(), b=x) is Eq(Zero(), x)
+        # The default base is shared too.
+        assert Numeral(3) is Numeral(3, Zero())
+        assert Numeral(3) is Numeral(n=3, base=None)
+        assert Numeral(1, Numeral(2)) is Numeral(3)
+
+
+def test_pickle_and_deepcopy_keep_equality():
+    f = ForAll(
+        "x",
+        Implies(
+            Eq(Add(Var("x"), Numeral(3, Var("y"))), Var("x")),
+            Not(And(Eq(Mul(Zero(), Var("x")), Succ(Var("z"))), Eq(Zero(), Zero()))),
+        ),
+    )
+    for copied in [pickle.loads(pickle.dumps(f)), copy.deepcopy(f)]:
+        assert copied is not f
+        assert copied == f and hash(copied) == hash(f)
+        assert str(copied) == str(f)
+        assert copied in {f: None}
+        assert copied != ForAll("x", Eq(Var("x"), Var("x")))
+
+
+def test_structural_key_distinguishes_free_vars():
+    assert Eq(Var("x"), Var("y")) != Eq(Var("x"), Var("x"))
+    assert hash(Eq(Var("x"), Var("y"))) != hash(Eq(Var("x"), Var("x")))
+    assert hash(Eq(Var("x"), Var("y"))) == hash(Eq(Var("x"), Var("y")))
+
+
+def test_structural_key_bound_vs_free():
+    bound = ForAll("x", Eq(Var("x"), Var("x")))
+    mixed = ForAll("y", Eq(Var("y"), Var("x")))
+    assert bound != mixed
+    assert not match_template(bound, mixed, [])
+
+
+def test_structural_key_binder_depth():
+    f0 = ForAll("x", ForAll("y", Eq(Var("x"), Var("y"))))
+    f1 = ForAll("a", ForAll("b", Eq(Var("a"), Var("b"))))
+    f2 = ForAll("a", ForAll("b", Eq(Var("b"), Var("a"))))
+    f3 = ForAll("x", ForAll("x", Eq(Var("x"), Var("x"))))
+    f4 = ForAll("a", ForAll("b", Eq(Var("b"), Var("b"))))
+    assert f0 == f1
+    assert f0 != f2
+    assert f3 == f4
+    assert f3 != f0
+
+
+def test_fingerprint_survives_rebuilding():
+    def build():
+        return ForAll("x", Implies(Eq(Var("x"), Var("y")), Eq(Var("y"), Var("x"))))
+
+    fingerprint = get_fingerprint(build())
+    # The first formula and its key are gone by now.
+    assert get_fingerprint(build()) == fingerprint
+    f = ForAll("z", Implies(Eq(Var("z"), Var("y")), Eq(Var("y"), Var("z"))))
+    assert get_fingerprint(f) == fingerprint
+    assert get_fingerprint(substitute_forall(f, Zero())) != fingerprint
+
+
+def _deep_succ(base, depth):
+    f = base
+    for _ in range(depth):
+        f = Succ(f)
+    return f
+
+
+def test_deep_formulae_are_stack_safe():
+    depth = 100000
+    f = ForAll("x", Eq(_deep_succ(Var("x"), depth), Var("y")))
+    g = ForAll("z", Eq(_deep_succ(Var("z"), depth), Var("y")))
+
+    assert f == g
+    assert len(list(get_all_subformulae(f))) == depth + 4
+    assert get_free_vars(f) == {"y"}
+    assert match_template(f.body, g.body, ["x"])
+
+    subst = replace_subformula(substitute_forall(f, Zero()), Var("y"), Zero())
+    assert str(subst) == f"({'S(' * depth}0{')' * depth} = 0)"
+
+
+def test_numeral_equals_succ_chain():
+    assert Numeral(5) == _deep_succ(Zero(), 5)
+    assert hash(Numeral(5)) == hash(_deep_succ(Zero(), 5))
+    assert Numeral(2, Numeral(3)) == Numeral(5)
+    assert Succ(Numeral(4, Var("x"))) == Numeral(5, Var("x"))
+    assert Numeral(5) != Numeral(4)
+    assert str(Numeral(3, Var("x"))) == "S(S(S(x)))"
+    assert Numeral(3).x == Numeral(2)
+    assert Numeral(1).x == Zero()
+
+
+def test_numeral_subformulae():
+    subformulae = list(get_all_subformulae(Eq(Numeral(3), Zero())))
+    assert [str(f) for f in subformulae] == [
+        "(S(S(S(0))) = 0)",
+        "S(S(S(0)))",
+        "S(S(0))",
+        "S(0)",
+        "0",
+        "0",
+    ]
+
+
+def test_numeral_match_template():
+    captures = {}
+    assert match_template(Succ(Var("x")), Numeral(1000), ["x"], captures)
+    assert captures["x"] == Numeral(999)
+
+    captures = {}
+    template = Add(Var("x"), Succ(Var("y")))
+    assert match_template(
+        template, Add(Numeral(7), Numeral(1000)), ["x", "y"], captures
+    )
+    assert captures["x"] == Numeral(7)
+    assert captures["y"] == Numeral(999)
+
+    assert match_template(Numeral(2, Var("x")), Numeral(5), ["x"])
+    assert not match_template(Numeral(6, Var("x")), Numeral(5), ["x"])
+    assert match_template(_deep_succ(Zero(), 40), Numeral(40), [])
+
+
+def test_numeral_substitution():
+    f = ForAll("x", Eq(Numeral(1000, Var("x")), Var("x")))
+    subst = substitute_forall(f, Numeral(3))
+    assert subst == Eq(Numeral(1003), Numeral(3))
+    assert type(subst.a) == Numeral
+
+
+def test_numeral_replace_subformula():
+    assert replace_subformula(Numeral(5), Numeral(2), Var("y")) == Numeral(3, Var("y"))
+    assert replace_subformula(Numeral(5), Zero(), Var("y")) == Numeral(5, Var("y"))
+    assert replace_subformula(Numeral(5), Numeral(5), Zero()) == Zero()
+    assert replace_subformula(Numeral(5), Numeral(6), Zero()) == Numeral(5)
+
+
+def test_cached_metadata():
+    f = ForAll(
+        "x", Implies(Eq(Var("x"), Numeral(3)), ForAll("y", Eq(Var("y"), Var("z"))))
+    )
+    assert get_free_vars(f) == {"z"}
+    assert get_bound_vars(f) == {"x", "y"}
+    assert contains_forall(f)
+    assert not contains_forall(f.body.p)
+    assert get_size(f) == 12
+    assert get_depth(f) == 7
+    assert get_size(Numeral(3)) == get_size(_deep_succ(Zero(), 3))
+    assert get_depth(Numeral(3)) == get_depth(_deep_succ(Zero(), 3))
+
+
+def test_match_template_size_mismatch():
+    template = ForAll("x", Eq(Var("x"), Add(Var("A"), Zero())))
+    assert not match_template(
+        template, ForAll("x", Eq(Add(Var("x"), Zero()), Add(Zero(), Zero()))), ["A"]
+    )
+    assert match_template(
+        template, ForAll("y", Eq(Var("y"), Add(Succ(Zero()), Zero()))), ["A"]
+    )
+
+
+def test_substitution_shares_untouched_subtrees():
+    untouched = ForAll("y", Eq(Add(Var("y"), Var("z")), Numeral(3)))
+    f = ForAll("x", Implies(Eq(Var("x"), Zero()), untouched))
+    subst = substitute_forall(f, Succ(Zero()))
+    assert subst.q is untouched
+    assert substitute_free_var(f, "x", Zero()) is f
+
+    replaced = replace_subformula(f, Var("x"), Var("w"))
+    assert replaced.body.q is untouched
+
+
+def test_substitute_foralls():
+    f = ForAll("x", ForAll("y", ForAll("x", Eq(Var("x"), Var("y")))))
+    assert substitute_foralls(f, [Zero(), Numeral(2)]) == ForAll(
+        "x", Eq(Var("x"), Numeral(2))
+    )
+    assert substitute_foralls(f, [Zero(), Numeral(2), Numeral(1)]) == Eq(
+        Numeral(1), Numeral(2)
+    )
+
+
+def test_replace_subformula_shared_subtrees():
+    shared = Add(Mul(Var("x"), Zero()), Var("y"))
+    f = Eq(Add(shared, Numeral(2)), Mul(shared, shared))
+    replaced = replace_subformula(f, Mul(Var("x"), Zero()), Zero())
+    assert replaced == Eq(
+        Add(Add(Zero(), Var("y")), Numeral(2)),
+        Mul(Add(Zero(), Var("y")), Add(Zero(), Var("y"))),
+    )
+    # Each shared subtree is rewritten once and the result is shared too.
+    assert replaced.a.a is replaced.b.a is replaced.b.b
+
+    # A callable replacement is still called once per instance.
+    names = iter(["a", "b", "c"])
+    replaced = replace_subformula(f, shared, lambda: Var(next(names)))
+    assert str(replaced) == "((a + S(S(0))) = (b * c))"
+
+
+def test_compile_template():
+    template = ForAll("x", Eq(Mul(Var("x"), Var("A")), Succ(Var("B"))))
+    match = compile_template(template, ["A", "B"])
+    captures = {}
+    assert match(ForAll("y", Eq(Mul(Var("y"), Zero()), Numeral(3))), captures)
+    assert captures == {"A": Zero(), "B": Numeral(2)}
+    assert not match(ForAll("y", Eq(Mul(Var("y"), Zero()), Zero())))
+    # Captures can't refer to a binder in the matched formula.
+    assert not match(ForAll("y", Eq(Mul(Var("y"), Var("y")), Numeral(3))))
+
+    # Alpha-equivalent templates share their compiled program.
+    num_compiled = len(formula._COMPILED_TEMPLATES)
+    template = ForAll("z", Eq(Mul(Var("z"), Var("A")), Succ(Var("B"))))
+    assert compile_template(template, ["B", "A", "C"])(
+        ForAll("y", Eq(Mul(Var("y"), Zero()), Numeral(3)))
+    )
+    assert len(formula._COMPILED_TEMPLATES) == num_compiled
+
+
+def test_match_template_rejects_captured_repeats():
+    # The first x matches a free y, but the second one would be captured by the
+    # binder around it.
+    x = Var("x")
+    y = Var("y")
+    template = And(Eq(x, Zero()), ForAll("y", Eq(x, y)))
+    f = And(Eq(y, Zero()), ForAll("y", Eq(y, y)))
+    assert substitute_free_var(template, "x", y) == f
+    assert not match_template(template, f, ["x"])
+    assert not compile_template(template, ["x"])(f)
+
+    # With the binder renamed, y is free both times and matches.
+    f = And(Eq(y, Zero()), ForAll("z", Eq(y, Var("z"))))
+    assert match_template(template, f, ["x"])
+    assert compile_template(template, ["x"])(f)
+
+
+def test_compiled_templates_match_interpreter():
+    rng = random.Random(0)
+    names = ["x", "y", "z"]
+
+    num_matches = 0
+    for _ in range(1000):
+        template = random_pred(rng, names, 3)
+        vars_to_capture = rng.sample(names, rng.randint(0, 2))
+        if rng.random() < 0.8:
+            f = template
+            for var in vars_to_capture:
+                f = substitute_free_var(f, var, random_term(rng, names, 1))
+        else:
+            f = random_pred(rng, names, 3)
+
+        expected_captures = {}
+        expected = formula._match_free_vars(
+            template, f, set(vars_to_capture), expected_captures
+        )
+        captures = {}
+        assert compile_template(template, vars_to_capture)(f, captures) == expected
+        if expected:
+            assert captures == expected_captures
+        # Seen twice, so matched by the compiled program.
+        assert match_template(template, f, vars_to_capture) == expected
+        num_matches = num_matches + expected
+    assert 300 < num_matches < 900
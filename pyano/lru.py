@@ -0,0 +1,61 @@
+"""A bounded least-recently-used cache."""
+
+
+class LRUCache:
+    """Maps keys to values, keeping at most `maxsize` entries by evicting the least
+    recently used one.
+
+    Unlike `functools.lru_cache` it doesn't wrap a function, so the caller decides
+    how each missing value is computed and whether to store it.
+
+    >>> cache = LRUCache(2)
+    >>> cache["a"] = 1
+    >>> cache["b"] = 2
+    >>> cache.get("a")
+    1
+    >>> cache["c"] = 3
+    >>> "b" in cache
+    False
+    >>> sorted(cache.keys())
+    ['a', 'c']
+
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # Dicts keep insertion order, so entries are kept least recently used first
+        # and re-inserting an entry marks it most recently used.
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        return self._entries.keys()
+
+    def get(self, key, default=None):
+        """Returns the value of `key`, marking it most recently used, or `default`
+        if the cache doesn't have it.
+
+        """
+
+        entries = self._entries
+        if key not in entries:
+            return default
+        value = entries.pop(key)
+        entries[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        entries = self._entries
+        if key in entries:
+            del entries[key]
+        elif len(entries) >= self.maxsize:
+            del entries[next(iter(entries))]
+        entries[key] = value
+
+    def clear(self):
+        self._entries.clear()
@@ -4,44 +4,289 @@ from axioms import *
 from formula_helpers import *
 
 
+class LemmaLibrary:
+    """Proofs of lemmas shared between `ProofBuilder`s, so that each lemma is only
+    proved and checked once however many builders use it.
+
+    Lemmas are keyed by the theorem they prove as it is printed, so a proof always
+    uses the variable names it was asked for:
+
+    >>> lemmas = LemmaLibrary()
+    >>> builder = ProofBuilder(lemmas=lemmas)
+    >>> print(builder.prove_eq_is_symmetric())
+    (forall x, y. (x = y) => (y = x))
+    >>> len(lemmas)
+    1
+    >>> ProofBuilder(lemmas=lemmas).prove_eq_is_symmetric() in lemmas
+    True
+
+    """
+
+    def __init__(self):
+        # Maps each printed theorem to its proof and the proof's certificate.
+        self._lemmas = {}
+
+    def __len__(self):
+        return len(self._lemmas)
+
+    def __contains__(self, theorem):
+        return str(theorem) in self._lemmas
+
+    def get_proof(self, theorem, prove_fn):
+        """Returns the proof of `theorem` and its certificate (see
+        `ProofBuilder.certificate`).
+
+        If the library doesn't have a proof yet, `prove_fn` is called with a new
+        `ProofBuilder` that uses this library, and the proof it builds is checked
+        and stored.  `prove_fn` must leave `theorem` as the last formula.
+
+        """
+
+        key = str(theorem)
+        lemma = self._lemmas.get(key)
+        if lemma is None:
+            builder = ProofBuilder(lemmas=self)
+            prove_fn(builder)
+            builder.assert_proved(theorem)
+            proof = tuple(builder.proof)
+            certificate = builder.certificate
+            assert_certificate_is_valid(proof, certificate)
+            lemma = (proof, tuple(certificate))
+            self._lemmas[key] = lemma
+        return lemma
+
+
 class ProofBuilder:
-    """`ProofBuilder` is a stateful helper for constructing formal proofs."""
+    """`ProofBuilder` is a stateful helper for constructing formal proofs.
+
+    Lemmas proved with `lemma`, such as the symmetry and transitivity of equality,
+    are taken from `lemmas` if it is a `LemmaLibrary`.
 
-    def __init__(self, check_each_step=False):
+    """
+
+    def __init__(self, check_each_step=False, lemmas=None):
         self._proof = []
-        self._proved_eq_is_symmetric = False
-        self._proved_eq_is_transitive = False
-        self._check_each_step = check_each_step
+        self._lemmas = lemmas
+        # Checks each step as it is added when `check_each_step` is set.
+        self._checker = IncrementalProofChecker() if check_each_step else None
+        # How each step follows from the earlier ones, see `certificate`.
+        self._justifications = []
+        self._step_indices = {}
+        self._implication_indices = {}
+        # The axiom schema of formulae that have been checked to be axioms, and
+        # the schema callers said other formulae are, see `p`.
+        self._axiom_schemas = {}
+        self._claimed_schemas = {}
+        # Formulae `simplify_proof` keeps, see `pin`.
+        self._pinned = set()
+
+    def p(self, formula, schema=None):
+        """Adds `formula` to the proof and returns it.  `schema` is the name of the
+        axiom schema `formula` is an instance of, if the caller knows it.  It is
+        put in the `certificate` as it is, and only trusted elsewhere once it has
+        been checked.
+
+        """
 
-    def p(self, formula):
         self._proof.append(formula)
-        if self._check_each_step:
-            assert_proof_is_valid(self._proof)
+        self._add_justification(formula, schema)
+        if self._checker is not None:
+            self._checker.append(formula)
+        return formula
+
+    def _add_justification(self, step, schema=None):
+        # Records how `step`, the last step of the proof, follows from the earlier
+        # ones: None for comments, ("mp", impl_idx, ant_idx) if an earlier
+        # implication and its antecedent give it, and ("axiom",) otherwise.  The
+        # axiom schema `step` is claimed to be an instance of is recorded if it is
+        # given, otherwise `certificate` looks it up.
+        idx = len(self._justifications)
+        if isinstance(step, str):
+            self._justifications.append(None)
+            return
+
+        if schema is not None:
+            self._claimed_schemas[step] = schema
+
+        step_idx = self._step_indices.get(step)
+        if step_idx is not None:
+            # A repeat is justified the same way as the first occurrence.
+            self._justifications.append(self._justifications[step_idx])
+            return
+
+        justification = ("axiom",)
+        for impl_idx in self._implication_indices.get(step, ()):
+            ant_idx = self._step_indices.get(self._proof[impl_idx].p)
+            if ant_idx is not None:
+                justification = ("mp", impl_idx, ant_idx)
+                break
+
+        self._justifications.append(justification)
+        self._step_indices[step] = idx
+        if isinstance(step, Implies):
+            self._implication_indices.setdefault(step.q, []).append(idx)
+
+    def lemma(self, theorem, prove_fn):
+        """Proves `theorem` with `prove_fn`, which is called with a `ProofBuilder`
+        and must leave `theorem` as its last formula.  Returns `theorem`.
+
+        Nothing is added if the proof already has `theorem`.  If the builder has a
+        `LemmaLibrary` then the proof is copied from the library, which only calls
+        `prove_fn` the first time and has already checked the steps, so with
+        `check_each_step` its axioms are trusted and only its modus ponens steps
+        are checked again.  Otherwise `prove_fn` is called with this builder.
+
+        """
+
+        # Look at the steps the proof has now: `simplify_proof` may have removed
+        # an earlier proof of `theorem`.
+        if theorem in self._step_indices:
+            return theorem
+        if self._lemmas is None:
+            prove_fn(self)
+            self.assert_proved(theorem)
+            return theorem
+
+        proof, certificate = self._lemmas.get_proof(theorem, prove_fn)
+        for step, justification in zip(proof, certificate):
+            # The certificate has been checked, so its axioms are trusted.
+            schema = None
+            if justification is not None and justification[0] == "axiom":
+                schema = justification[1]
+                self._axiom_schemas[step] = schema
+            self._proof.append(step)
+            self._add_justification(step)
+            if self._checker is not None:
+                self._checker.append_checked(step, schema)
+        return theorem
+
+    def pin(self, formula=None):
+        """Marks `formula`, by default the last formula of the proof, as a result
+        that `simplify_proof` keeps along with the steps it depends on.  Returns
+        the formula.
+
+        """
+
+        if formula is None:
+            formula = self.last_formula
+        self._pinned.add(formula)
         return formula
 
     def simplify_proof(self):
-        """Removes redundant formulae from the proof.  Returns the number of such formulae
-        removed.
+        """Removes redundant formulae from the proof: repeats of earlier formulae,
+        and formulae that neither the last formula nor a pinned one (see `pin`)
+        depends on.  Comments are kept as long as a formula after them is.
+        Returns the number of formulae removed.
 
         """
+        num_steps = len(self._proof)
         formulae = set()
         new_proof = []
         for p in self.proof:
             if p not in formulae:
                 new_proof.append(p)
                 formulae.add(p)
-        formulae_removed = len(self._proof) - len(new_proof)
-        self._proof = new_proof
-        return formulae_removed
+        self._set_proof(new_proof)
+
+        # Walk the modus ponens dependencies back from the results.  A step that
+        # is an axiom doesn't depend on anything, even if modus ponens gives it
+        # too.
+        live = [False] * len(new_proof)
+        stack = [
+            idx
+            for idx, p in enumerate(new_proof)
+            if isinstance(p, Formula) and p in self._pinned
+        ]
+        last_formula = self.last_formula
+        if last_formula is not None:
+            stack.append(self._step_indices[last_formula])
+        while stack:
+            idx = stack.pop()
+            if live[idx]:
+                continue
+            live[idx] = True
+            justification = self._justifications[idx]
+            if justification[0] == "mp" and (
+                self._get_axiom_schema(new_proof[idx]) is None
+            ):
+                stack.append(justification[1])
+                stack.append(justification[2])
+
+        # Keep the comments before each run of formulae with a live formula.
+        run_is_live = False
+        for idx in range(len(new_proof) - 1, -1, -1):
+            if isinstance(new_proof[idx], str):
+                live[idx] = run_is_live
+                run_is_live = False
+            else:
+                run_is_live = run_is_live or live[idx]
+
+        if not all(live):
+            self._set_proof([p for p, is_live in zip(new_proof, live) if is_live])
+
+        if self._checker is not None and len(self._proof) < num_steps:
+            # The steps have been renumbered, so start over.
+            self._checker = IncrementalProofChecker()
+            for p in self._proof:
+                self._checker.append(p)
+        return num_steps - len(self._proof)
+
+    def _set_proof(self, proof):
+        # Replaces the proof with `proof`, whose steps have been renumbered, so
+        # their justifications are recorded again.
+        self._proof = []
+        self._justifications = []
+        self._step_indices = {}
+        self._implication_indices = {}
+        for p in proof:
+            self._proof.append(p)
+            self._add_justification(p)
+
+    def _get_axiom_schema(self, formula):
+        # `get_axiom_schema`, looked up once per distinct formula.  A claimed
+        # schema only needs that one schema to be checked.
+        if formula not in self._axiom_schemas:
+            schema = self._claimed_schemas.get(formula)
+            if schema is None or not is_axiom_of_schema(formula, schema):
+                schema = get_axiom_schema(formula)
+            self._axiom_schemas[formula] = schema
+        return self._axiom_schemas[formula]
 
     @property
     def proof(self):
         return self._proof
 
+    @property
+    def certificate(self):
+        """Returns a certificate that justifies each step of the proof, which
+        `assert_certificate_is_valid` checks without searching for justifications.
+
+        Modus ponens steps are recorded as they are added.  Other steps are
+        assumed to be axioms, of the schema they were added with (see `p`), which
+        isn't checked here.  Only the axioms added without one are classified
+        with `get_axiom_schema` here, once per distinct formula.
+
+        """
+
+        certificate = []
+        for step, justification in zip(self._proof, self._justifications):
+            if justification is not None and justification[0] == "axiom":
+                schema = self._claimed_schemas.get(step)
+                if schema is None:
+                    schema = self._get_axiom_schema(step)
+                justification = ("axiom", schema)
+            certificate.append(justification)
+        return certificate
+
     def __str__(self):
+        # Comments are marked with "# " so that `proof_parser` can tell them apart
+        # from formulae.
         fs = []
         for i, p in enumerate(self.proof):
-            fs.append(f"{i}. {p}\n")
+            if isinstance(p, str):
+                fs.append(f"{i}. # {p}\n")
+            else:
+                fs.append(f"{i}. {p}\n")
         return "".join(fs)
 
     @property
@@ -80,7 +325,8 @@ class ProofBuilder:
                 forall,
                 _forallx(forall.body.p),
                 _forallx(forall.body.q),
-            )
+            ),
+            FORALL_SPLIT,
         )
 
     def _forallxy_split(self, forall):
@@ -106,11 +352,11 @@ class ProofBuilder:
 
         A_B_C = ImpliesN(A, B, C)
 
-        p(D)
-        p(ImpliesN(D, A, E))
+        p(D, FORALL_SPLIT)
+        p(ImpliesN(D, A, E), FORALL_SPLIT)
         A_E = p(ImpliesN(A, E))
-        E_B_C = p(ImpliesN(E, B, C))
-        return self.immediately_implies(A_E, E_B_C, A_B_C)
+        E_B_C = p(ImpliesN(E, B, C), FORALL_SPLIT)
+        return self.immediately_implies(A_E, E_B_C, A_B_C, schema=TAUTOLOGY)
 
     def _forallxyz_split(self, forall):
         p = self.p
@@ -143,7 +389,7 @@ class ProofBuilder:
         FZ_P_FZ_Q = Implies(forallz(P), forallz(Q))
         assert forallxy(FZ_P_Q) == A
 
-        p(forallxy(Implies(FZ_P_Q, FZ_P_FZ_Q)))
+        p(forallxy(Implies(FZ_P_Q, FZ_P_FZ_Q)), FORALL_SPLIT)
 
         X = self.forall_split()
         self.assert_proved(forallxy(FZ_P_FZ_Q))
@@ -151,7 +397,7 @@ class ProofBuilder:
         Y = self.forall_split("med")
         self.assert_proved(Implies(_forallxyz(P), _forallxyz(Q)))
 
-        return self.immediately_implies(X, Y, A_B_C)
+        return self.immediately_implies(X, Y, A_B_C, schema=TAUTOLOGY)
 
     def forall_split(self, resolution_level="high", forall=None):
         """From "forall x. P(x) => Q(x)" do one of three things depending on the value of
@@ -207,11 +453,11 @@ class ProofBuilder:
     def prove_eq_is_symmetric(self):
         """Proves f xy. (x=y => y=x)"""
 
-        if self._proved_eq_is_symmetric:
-            return
-
-        self._proved_eq_is_symmetric = True
+        v = get_cached_vars()
+        theorem = forallxy(Implies(Eq(v.x, v.y), Eq(v.y, v.x)))
+        return self.lemma(theorem, ProofBuilder._prove_eq_is_symmetric)
 
+    def _prove_eq_is_symmetric(self):
         v = get_cached_vars()
         p = self.p
 
@@ -227,30 +473,31 @@ class ProofBuilder:
                     ImpliesN(X_Y, X_X, Y_X),
                     ImpliesN(X_X, X_Y, Y_X),
                 )
-            )
+            ),
+            TAUTOLOGY,
         )
 
         self.forall_split("med")
-        p(forallxy(ImpliesN(X_Y, X_X, Y_X)))  # Subst axiom
+        p(forallxy(ImpliesN(X_Y, X_X, Y_X)), SUBST)
         p(forallxy(ImpliesN(X_X, X_Y, Y_X)))
 
         self.forall_split("med")
-        p(forallyx(X_X))
+        p(forallyx(X_X), REFLEXIVITY)
         self.flip_xy_order_in_forall()
         return p(theorem)
 
-    def immediately_implies(self, *formulae):
+    def immediately_implies(self, *formulae, schema=None):
         """`immediately_implies(A, B, C, ...)` first adds `A->B->C->...` to the proof then
         `B->C->...` and then `C->...` and so on.
 
         This is useful when A, B, C, ... have been proved already and the `A->B->C->...`
-        implication is an axiom.
+        implication is an axiom, whose schema can be given as `schema`.
 
         """
         if len(formulae) == 1:
             formulae = (self.last_formula,) + formulae
 
-        self.p(ImpliesN(*formulae))
+        self.p(ImpliesN(*formulae), schema)
         if len(formulae) > 2:
             return self.immediately_implies(*formulae[1:])
         else:
@@ -262,7 +509,6 @@ class ProofBuilder:
         if eq is None:
             eq = self.last_formula
 
-        v = get_cached_vars()
         p = self.p
 
         varlist = []
@@ -287,34 +533,40 @@ class ProofBuilder:
         def _forallxy(body):
             return ForAllN([vx.name, vy.name], body)
 
-        self.prove_eq_is_symmetric()
-
-        symmetric_axiom = p(_forallxy(Implies(Eq(vx, vy), Eq(vy, vx))))
+        symmetric_axiom = _forallxy(Implies(Eq(vx, vy), Eq(vy, vx)))
+
+        def prove_wrapped_symmetric_axiom(builder):
+            builder.prove_eq_is_symmetric()
+            builder.p(symmetric_axiom)
+            wrapped_symmetric_axiom = symmetric_axiom
+            for v in varlist[::-1]:
+                wrapped_symmetric_axiom = ForAll(v, wrapped_symmetric_axiom)
+                builder.immediately_implies(
+                    wrapped_symmetric_axiom.body,
+                    wrapped_symmetric_axiom,
+                    schema=FORALL_INTRODUCTION,
+                )
 
-        wrapped_symmetric_axiom = symmetric_axiom
-        for v in varlist[::-1]:
-            wrapped_symmetric_axiom = ForAll(v, wrapped_symmetric_axiom)
-            self.immediately_implies(
-                wrapped_symmetric_axiom.body, wrapped_symmetric_axiom
-            )
+        self.lemma(_forall(symmetric_axiom), prove_wrapped_symmetric_axiom)
 
         subst_F = substitute_forall(symmetric_axiom, F)
         subst_FG = substitute_forall(subst_F, G)
 
-        p(_forall(Implies(symmetric_axiom, subst_F)))
+        p(_forall(Implies(symmetric_axiom, subst_F)), FORALL_ELIMINATION)
         self.forall_split()
 
-        p(_forall(Implies(subst_F, subst_FG)))
+        p(_forall(Implies(subst_F, subst_FG)), FORALL_ELIMINATION)
         self.forall_split()
         return self.forall_split()
 
     def prove_eq_is_transitive(self):
         """Proves forall x, y, z: x = y => y = z => x = z"""
-        if self._proved_eq_is_transitive:
-            return
 
-        self._proved_eq_is_transitive = True
+        v = get_cached_vars()
+        theorem = forallxyz(ImpliesN(Eq(v.x, v.y), Eq(v.y, v.z), Eq(v.x, v.z)))
+        return self.lemma(theorem, ProofBuilder._prove_eq_is_transitive)
 
+    def _prove_eq_is_transitive(self):
         v = get_cached_vars()
         p = self.p
 
@@ -329,22 +581,27 @@ class ProofBuilder:
 
         assert forallxyz(Q) == theorem
 
-        p(forallxyz(P))
-        p(forallxyz(Implies(P, Q)))
+        p(forallxyz(P), SUBST)
+        p(forallxyz(Implies(P, Q)), TAUTOLOGY)
         return self.forall_split()
 
     def _prove_values_transitively_equal_1arg(self, a, b, c):
         v = get_cached_vars()
         p = self.p
 
-        self.prove_eq_is_transitive()
-
         def body(x, y, z):
             return ImpliesN(Eq(x, y), Eq(y, z), Eq(x, z))
 
         eq_transitive = forallxyz(body(v.x, v.y, v.z))
         eq_transitive_m = forallm(eq_transitive)
-        self.immediately_implies(eq_transitive, eq_transitive_m)
+
+        def prove_eq_transitive_m(builder):
+            builder.prove_eq_is_transitive()
+            builder.immediately_implies(
+                eq_transitive, eq_transitive_m, schema=FORALL_INTRODUCTION
+            )
+
+        self.lemma(eq_transitive_m, prove_eq_transitive_m)
 
         A = a(v.m)
         B = b(v.m)
@@ -352,38 +609,61 @@ class ProofBuilder:
 
         theorem = forallm(body(A, B, C))
 
-        p(forallm(Implies(eq_transitive, forallyz(body(A, v.y, v.z)))))
+        p(
+            forallm(Implies(eq_transitive, forallyz(body(A, v.y, v.z)))),
+            FORALL_ELIMINATION,
+        )
 
         self.immediately_implies(
-            self.last_formula, eq_transitive_m, forallm(forallyz(body(A, v.y, v.z)))
+            self.last_formula,
+            eq_transitive_m,
+            forallm(forallyz(body(A, v.y, v.z))),
+            schema=FORALL_SPLIT,
         )
 
-        p(forallm(Implies(forallyz(body(A, v.y, v.z)), forallz(body(A, B, v.z)))))
+        p(
+            forallm(Implies(forallyz(body(A, v.y, v.z)), forallz(body(A, B, v.z)))),
+            FORALL_ELIMINATION,
+        )
         self.immediately_implies(
             self.last_formula,
             forallm(forallyz(body(A, v.y, v.z))),
             forallm(forallz(body(A, B, v.z))),
+            schema=FORALL_SPLIT,
         )
 
-        p(forallm(Implies(forallz(body(A, B, v.z)), body(A, B, C))))
+        p(
+            forallm(Implies(forallz(body(A, B, v.z)), body(A, B, C))),
+            FORALL_ELIMINATION,
+        )
         return self.immediately_implies(
-            self.last_formula, forallm(forallz(body(A, B, v.z))), theorem
+            self.last_formula,
+            forallm(forallz(body(A, B, v.z))),
+            theorem,
+            schema=FORALL_SPLIT,
         )
 
     def _prove_values_transitively_equal_2args(self, a, b, c):
         v = get_cached_vars()
         p = self.p
 
-        self.prove_eq_is_transitive()
-
         def body(x, y, z):
             return ImpliesN(Eq(x, y), Eq(y, z), Eq(x, z))
 
         eq_transitive = forallxyz(body(v.x, v.y, v.z))
         eq_transitive_m = forallm(eq_transitive)
-        self.immediately_implies(eq_transitive, eq_transitive_m)
         eq_transitive_mn = foralln(eq_transitive_m)
-        self.immediately_implies(eq_transitive, eq_transitive_mn)
+
+        def prove_eq_transitive_mn(builder):
+            builder.prove_eq_is_transitive()
+            builder.immediately_implies(
+                eq_transitive, eq_transitive_m, schema=FORALL_INTRODUCTION
+            )
+            builder.immediately_implies(
+                eq_transitive, eq_transitive_mn, schema=FORALL_INTRODUCTION
+            )
+
+        self.lemma(eq_transitive_mn, prove_eq_transitive_mn)
 
         A = a(v.m, v.n)
         B = b(v.m, v.n)
@@ -391,11 +671,20 @@ class ProofBuilder:
 
         theorem = forallmn(body(A, B, C))
 
-        p(forallmn(Implies(eq_transitive, forallyz(body(A, v.y, v.z)))))
+        p(
+            forallmn(Implies(eq_transitive, forallyz(body(A, v.y, v.z)))),
+            FORALL_ELIMINATION,
+        )
         self.forall_split()
-        p(forallmn(Implies(forallyz(body(A, v.y, v.z)), forallz(body(A, B, v.z)))))
+        p(
+            forallmn(Implies(forallyz(body(A, v.y, v.z)), forallz(body(A, B, v.z)))),
+            FORALL_ELIMINATION,
+        )
         self.forall_split()
-        p(forallmn(Implies(forallz(body(A, B, v.z)), body(A, B, C))))
+        p(
+            forallmn(Implies(forallz(body(A, B, v.z)), body(A, B, C))),
+            FORALL_ELIMINATION,
+        )
         return self.forall_split()
 
     def prove_values_transitively_equal(self, a, b, c, nargs=1):
@@ -422,12 +711,17 @@ class ProofBuilder:
         """
         v = get_cached_vars()
         assert forall.var != "t"
-        self.immediately_implies(forall, forallt(forall))
-        self.p(forallt(Implies(forall, substitute_forall(forall, f(v.t)))))
+        self.immediately_implies(forall, forallt(forall), schema=FORALL_INTRODUCTION)
+        self.p(
+            forallt(Implies(forall, substitute_forall(forall, f(v.t)))),
+            FORALL_ELIMINATION,
+        )
         return self.forall_split()
 
     def subst_forall_with_const(self, forall, c):
-        return self.immediately_implies(forall, substitute_forall(forall, c))
+        return self.immediately_implies(
+            forall, substitute_forall(forall, c), schema=FORALL_ELIMINATION
+        )
 
     def flip_xy_order_in_forall(self, forall=None):
         """Given "forall x, y. P(x, y)", proves "forall y, x. P(x, y)"."""
@@ -453,15 +747,20 @@ class ProofBuilder:
             return _forallx(_forally(body))
 
         def body(x, y):
-            return substitute_forall(substitute_forall(forall, x), y)
+            return substitute_foralls(forall, [x, y])
 
-        p(_forallxy(Implies(forall, foralln(body(vy, v.n)))))
+        p(_forallxy(Implies(forall, foralln(body(vy, v.n)))), FORALL_ELIMINATION)
         self.forall_split("med")
-        self.immediately_implies(forall, _forally(forall))
-        self.immediately_implies(_forally(forall), _forallxy(forall))
+        self.immediately_implies(forall, _forally(forall), schema=FORALL_INTRODUCTION)
+        self.immediately_implies(
+            _forally(forall), _forallxy(forall), schema=FORALL_INTRODUCTION
+        )
         self.immediately_implies(_forallxy(forall), _forallxy(foralln(body(vy, v.n))))
 
-        p(_forallxy(Implies(foralln(body(vy, v.n)), body(vy, vx))))
+        p(
+            _forallxy(Implies(foralln(body(vy, v.n)), body(vy, vx))),
+            FORALL_ELIMINATION,
+        )
         self.forall_split("med")
         return p(_forallxy(body(vy, vx)))
 
@@ -489,8 +788,8 @@ class ProofBuilder:
         # (forallyx. x=x) => forally. fn(y)=fn(y)
 
         x_eq_x = Eq(x, x)
-        p(_forally(_forallx(x_eq_x)))
-        p(_forally(Implies(_forallx(x_eq_x), Eq(expr, expr))))
+        p(_forally(_forallx(x_eq_x)), REFLEXIVITY)
+        p(_forally(Implies(_forallx(x_eq_x), Eq(expr, expr))), FORALL_ELIMINATION)
         self.forall_split()
 
     def apply_fn_on_eq(self, fn, eq=None):
@@ -510,7 +809,7 @@ class ProofBuilder:
             return ForAll(eq.var, body)
 
         self.prove_expr_eq_to_itself(fn(A), [eq.var])
-        p(_forallx(ImpliesN(eq.body, Eq(fn(A), fn(A)), Eq(fn(A), fn(B)))))
+        p(_forallx(ImpliesN(eq.body, Eq(fn(A), fn(A)), Eq(fn(A), fn(B)))), SUBST)
         self.forall_split()
         return self.forall_split()
 
@@ -523,13 +822,14 @@ class ProofBuilder:
             Implies(
                 ImpliesN(impl.p, impl.q.p, impl.q.q),
                 ImpliesN(impl.q.p, impl.p, impl.q.q),
-            )
+            ),
+            TAUTOLOGY,
         )
         return self.p(ImpliesN(impl.q.p, impl.p, impl.q.q))
 
     def compose_implications(self, a, b):
         """Given A->B and B->C prove A->C"""
-        self.p(ImpliesN(a, b, a.p, b.q))
+        self.p(ImpliesN(a, b, a.p, b.q), TAUTOLOGY)
         self.p(ImpliesN(b, a.p, b.q))
         return self.p(ImpliesN(a.p, b.q))
 
@@ -560,19 +860,19 @@ class ProofBuilder:
         return self.p(self._recursively_rename_forall_quantifier(var, formula))
 
     def peano_axiom_zero_is_not_succ(self):
-        return self.p(get_peano_axiom_zero_is_not_succ())
+        return self.p(get_peano_axiom_zero_is_not_succ(), FIRST_ORDER_PEANO)
 
     def peano_axiom_succ_is_injective(self):
-        return self.p(get_peano_axiom_succ_is_injective())
+        return self.p(get_peano_axiom_succ_is_injective(), FIRST_ORDER_PEANO)
 
     def peano_axiom_x_plus_zero(self):
-        return self.p(get_peano_axiom_x_plus_zero())
+        return self.p(get_peano_axiom_x_plus_zero(), FIRST_ORDER_PEANO)
 
     def peano_axiom_x_plus_succ_y(self):
-        return self.p(get_peano_axiom_x_plus_succ_y())
+        return self.p(get_peano_axiom_x_plus_succ_y(), FIRST_ORDER_PEANO)
 
     def peano_axiom_x_times_zero(self):
-        return self.p(get_peano_axiom_x_times_zero())
+        return self.p(get_peano_axiom_x_times_zero(), FIRST_ORDER_PEANO)
 
     def peano_axiom_x_times_succ_y(self):
-        return self.p(get_peano_axiom_x_times_succ_y())
+        return self.p(get_peano_axiom_x_times_succ_y(), FIRST_ORDER_PEANO)
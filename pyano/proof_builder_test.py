@@ -138,3 +138,135 @@ def test_simplify_proof():
     saved = builder.simplify_proof()
     assert saved == 1
     assert len(builder.proof) == 1
+
+
+def test_certificate_uses_recorded_schemas(monkeypatch):
+    builder = ProofBuilder()
+    builder.prove_eq_is_transitive()
+    builder.flip_equality(builder.peano_axiom_x_plus_zero())
+    builder.apply_fn_on_eq(Succ)
+    builder.subst_forall_with_const(builder.peano_axiom_x_times_zero(), Numeral(2))
+
+    # The helpers record the schema of every axiom they add, so none has to be
+    # looked up.
+    def get_axiom_schema(f):
+        assert False, f"Looked up the schema of {f}"
+
+    monkeypatch.setattr("proof_builder.get_axiom_schema", get_axiom_schema)
+    assert_certificate_is_valid(builder.proof, builder.certificate)
+
+
+def test_simplify_proof_removes_dead_steps():
+    builder = ProofBuilder()
+    builder.p("unused")
+    unused = builder.prove_eq_is_symmetric()
+    builder.p("x + 0 = x")
+    builder.peano_axiom_x_plus_zero()
+    theorem = builder.subst_forall_with_const(builder.last_formula, Zero())
+    assert builder.simplify_proof() > 0
+    assert builder.proof == [
+        "x + 0 = x",
+        get_peano_axiom_x_plus_zero(),
+        Implies(get_peano_axiom_x_plus_zero(), theorem),
+        theorem,
+    ]
+    assert unused not in builder.proof
+
+    # Pinned formulae are kept along with the steps they depend on.
+    symmetric_builder = ProofBuilder()
+    symmetric = symmetric_builder.prove_eq_is_symmetric()
+    symmetric_builder.simplify_proof()
+
+    builder = ProofBuilder()
+    builder.pin(builder.prove_eq_is_symmetric())
+    builder.peano_axiom_x_plus_zero()
+    builder.simplify_proof()
+    assert builder.proof == symmetric_builder.proof + [get_peano_axiom_x_plus_zero()]
+    assert symmetric in builder.proof
+    assert_proof_is_valid(builder.proof)
+    assert_certificate_is_valid(builder.proof, builder.certificate)
+
+
+def test_simplify_proof_checks_claimed_schemas():
+    # 0 = 0 follows by modus ponens, but is wrongly claimed to be an axiom.
+    x_eq_x = ForAll("x", Eq(Var("x"), Var("x")))
+    zero_eq_zero = Eq(Zero(), Zero())
+    builder = ProofBuilder()
+    builder.p(x_eq_x, REFLEXIVITY)
+    builder.p(Implies(x_eq_x, zero_eq_zero), FORALL_ELIMINATION)
+    builder.p(zero_eq_zero, REFLEXIVITY)
+    assert_proof_is_valid(builder.proof)
+
+    assert builder.simplify_proof() == 0
+    assert builder.proof == [x_eq_x, Implies(x_eq_x, zero_eq_zero), zero_eq_zero]
+    assert_proof_is_valid(builder.proof)
+    assert_certificate_is_valid(builder.proof, builder.certificate)
+
+
+def test_lemmas_removed_by_simplify_proof_are_proved_again():
+    v = get_cached_vars()
+    symmetric = forallxy(Implies(Eq(v.x, v.y), Eq(v.y, v.x)))
+    for lemmas in [None, LemmaLibrary()]:
+        builder = ProofBuilder(lemmas=lemmas)
+        builder.prove_eq_is_symmetric()
+        eq = builder.peano_axiom_x_plus_zero()
+        builder.simplify_proof()
+        assert symmetric not in builder.proof
+
+        builder.flip_equality(eq)
+        builder.assert_proved("(forall x. (x = (x + 0)))")
+        assert symmetric in builder.proof
+        assert_proof_is_valid(builder.proof)
+
+
+def test_check_each_step():
+    builder = ProofBuilder(check_each_step=True)
+    builder.prove_eq_is_symmetric()
+    builder.prove_eq_is_symmetric()
+    assert builder.simplify_proof() > 0
+
+    num_steps = len(builder.proof)
+    try:
+        builder.p(Eq(Zero(), Succ(Zero())))
+    except InvalidProofError as ipe:
+        assert ipe.invalid_formula_idx == num_steps
+    else:
+        assert False, "Expected proof verification to fail"
+
+
+def test_lemma_library():
+    v = get_cached_vars()
+    lemmas = LemmaLibrary()
+    num_calls = 0
+
+    def prove_x_plus_zero_eq_x(builder):
+        nonlocal num_calls
+        num_calls = num_calls + 1
+        builder.peano_axiom_x_plus_zero()
+        builder.flip_equality()
+        builder.flip_equality()
+
+    theorem = forallx(Eq(Add(v.x, Zero()), v.x))
+    proofs = []
+    for check_each_step in [False, True]:
+        builder = ProofBuilder(check_each_step=check_each_step, lemmas=lemmas)
+        builder.p("unrelated")
+        assert builder.lemma(theorem, prove_x_plus_zero_eq_x) == theorem
+        num_steps = len(builder.proof)
+        assert builder.lemma(theorem, prove_x_plus_zero_eq_x) == theorem
+        assert len(builder.proof) == num_steps
+        assert_proof_is_valid(builder.proof)
+        assert_certificate_is_valid(builder.proof, builder.certificate)
+        proofs.append(builder.proof)
+
+    # The lemma, and the lemmas it uses, were only proved once.
+    assert num_calls == 1
+    assert theorem in lemmas and builder.prove_eq_is_symmetric() in lemmas
+    assert proofs[0] == proofs[1]
+
+    # Without a library the lemma is proved in place, with the same steps.
+    builder = ProofBuilder()
+    builder.p("unrelated")
+    builder.lemma(theorem, prove_x_plus_zero_eq_x)
+    assert num_calls == 2
+    assert builder.proof == proofs[0]
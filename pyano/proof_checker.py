@@ -1,6 +1,8 @@
+from arena import proof_to_arena
 from axioms import *
 from formula import *
 
+import concurrent.futures
 import itertools
 
 
@@ -8,13 +10,6 @@ def _is_comment(proof_step):
     return isinstance(proof_step, str)
 
 
-def _get_previous_comment(proof, idx):
-    for p in proof[idx::-1]:
-        if _is_comment(p):
-            return p
-    return None
-
-
 class InvalidProofError(ValueError):
     def __init__(self, invalid_formula, invalid_formula_idx, last_comment):
         self._invalid_formula = invalid_formula
@@ -41,36 +36,331 @@ class InvalidProofError(ValueError):
         )
 
 
-def assert_proof_is_valid(proof):
-    """Raises an `InvalidProofError` if `proof` is invalid, otherwise returns normally.
+class IncrementalProofChecker:
+    """Checks a proof one step at a time.
 
-    A proof is a list of `Formula`s where each formula is either an axiom
-    itself, or follows from a previous formula.  See the "What is a correct
-    proof" section in README.md for a longer explanation.
+    Each call to `append` only checks the new step, against the steps appended so
+    far, so checking a proof as it is built takes linear time overall:
+
+    >>> checker = IncrementalProofChecker()
+    >>> checker.append("x = x for every x")
+    >>> checker.append(ForAll("x", Eq(Var("x"), Var("x"))))
+    >>> checker.append(Eq(Zero(), Zero()))
+    Traceback (most recent call last):
+    ...
+    proof_checker.InvalidProofError: Proof not valid: error at step number 2, last comment: x = x for every x
+    <BLANKLINE>
+    Invalid formula: (0 = 0)
+
+    A step that fails still counts towards the step numbers, but later steps can't
+    follow from it.
+
+    If `arena` is a `FormulaArena` then the appended formulae are handles into it
+    (see `proof_to_arena`).
+
+    Given the `last_uses` of the proof (see `get_last_uses`), formulae are
+    forgotten as soon as no later step can follow from them, so memory use stays
+    proportional to the formulae that are still needed rather than to the length
+    of the proof.
     """
 
-    implications = {}
-    valid_formulae = set()
+    def __init__(self, arena=None, last_uses=None):
+        self._arena = arena
+        # Maps each formula that is the conclusion of an implication in the proof to
+        # the set of its antecedents.
+        self._implications = {}
+        self._valid_formulae = set()
+        self._num_steps = 0
+        self._last_comment = None
+        self._last_uses = last_uses
+        # Maps the index of a step to the entries that aren't needed after it, as
+        # (formula, is_conclusion): a formula in `_valid_formulae`, or a key of
+        # `_implications` if `is_conclusion` is set.
+        self._expiring = {}
 
-    for formula_idx, formula in enumerate(proof):
-        # Strings are comments and are skipped over.  We return the last comment before
-        # an incorrect formula which can help narrow down the bug.
-        if _is_comment(formula):
-            continue
+    def __len__(self):
+        """Returns the number of steps appended so far, including comments."""
+
+        return self._num_steps
+
+    def get_num_kept_formulae(self):
+        """Returns the number of formulae kept for checking later steps: the valid
+        formulae, and the conclusions of the valid implications.  With `last_uses`
+        it drops back to 0 after the last step.
+
+        """
+
+        return len(self._valid_formulae) + len(self._implications)
+
+    def append(self, step):
+        """Checks `step`, which may be a comment, and adds it to the proof.  Raises
+        an `InvalidProofError` if `step` is neither an axiom nor follows from
+        earlier steps.
+
+        """
+
+        self._append(step, None)
+
+    def append_checked(self, step, schema):
+        """Adds `step`, which may be a comment, to the proof, trusting that it is an
+        instance of the axiom schema named `schema` instead of checking it, e.g.
+        because it comes from a proof that has already been checked.
+
+        If `schema` is None then `step` must follow from earlier steps by modus
+        ponens, which is still checked, but it is never checked for being an
+        axiom.  Raises an `InvalidProofError` if it doesn't follow.
 
-        ok = is_axiom(formula) or (
+        """
+
+        self._append(step, schema is not None)
+
+    def _append(self, step, step_is_axiom):
+        # `step_is_axiom` is whether `step` is an axiom if that is already known,
+        # otherwise None.
+        formula_idx = self._num_steps
+        self._num_steps = self._num_steps + 1
+
+        # Strings are comments and are skipped over.  We keep the last comment to
+        # report it with an incorrect formula, which can help narrow down the bug.
+        if _is_comment(step):
+            self._last_comment = step
+            return
+
+        formula = step
+        if self._arena is not None:
+            formula = self._arena.to_formula(formula)
+
+        implications = self._implications
+        valid_formulae = self._valid_formulae
+        if step_is_axiom is None:
+            step_is_axiom = is_axiom(formula)
+        ok = step_is_axiom or (
             formula in implications
             and any([ant in valid_formulae for ant in implications[formula]])
         )
 
         if not ok:
-            prev_comment = _get_previous_comment(proof, formula_idx)
-            raise InvalidProofError(formula, formula_idx, prev_comment)
+            raise InvalidProofError(formula, formula_idx, self._last_comment)
 
-        valid_formulae.add(formula)
+        if self._last_uses is None:
+            valid_formulae.add(formula)
+            if isinstance(formula, Implies):
+                if formula.q not in implications:
+                    implications[formula.q] = set([formula.p])
+                else:
+                    implications[formula.q].add(formula.p)
+            return
+
+        # Only keep what later steps may look up, until the last step that may.
+        antecedent_last_uses, conclusion_last_uses = self._last_uses
+        last_use = antecedent_last_uses.get(get_fingerprint(formula), -1)
+        if last_use > formula_idx:
+            valid_formulae.add(formula)
+            self._expiring.setdefault(last_use, []).append((formula, False))
 
         if isinstance(formula, Implies):
-            if formula.q not in implications:
-                implications[formula.q] = set([formula.p])
+            last_use = conclusion_last_uses.get(get_fingerprint(formula.q), -1)
+            if last_use > formula_idx:
+                if formula.q not in implications:
+                    implications[formula.q] = set([formula.p])
+                    self._expiring.setdefault(last_use, []).append((formula.q, True))
+                else:
+                    implications[formula.q].add(formula.p)
+
+        for f, is_conclusion in self._expiring.pop(formula_idx, ()):
+            if is_conclusion:
+                del implications[f]
             else:
-                implications[formula.q].add(formula.p)
+                valid_formulae.discard(f)
+
+
+def get_last_uses(proof, arena=None):
+    """Returns where each formula in `proof` is last needed by modus ponens, for
+    `IncrementalProofChecker` and `assert_proof_is_valid` to forget formulae
+    after their last use.
+
+    This is a separate pass over the proof, which can be an iterable like in
+    `assert_proof_is_valid`.  It only keeps fingerprints of formulae, structural
+    hashes that stay the same when a formula is parsed again: for each formula
+    the index of the last step that may need it as the antecedent of an
+    implication, and for each conclusion of an implication the index of the last
+    step that is that conclusion.  Formulae with the same fingerprint share their
+    last uses, which can only keep a formula longer than necessary.
+    """
+
+    antecedent_last_uses = {}
+    conclusion_last_uses = {}
+    # Maps the fingerprint of each conclusion of an implication so far to the
+    # fingerprints of its antecedents.
+    antecedents = {}
+    for formula_idx, step in enumerate(proof):
+        if _is_comment(step):
+            continue
+
+        formula = step
+        if arena is not None:
+            formula = arena.to_formula(formula)
+
+        fingerprint = get_fingerprint(formula)
+        if fingerprint in antecedents:
+            conclusion_last_uses[fingerprint] = formula_idx
+            for antecedent in antecedents[fingerprint]:
+                antecedent_last_uses[antecedent] = formula_idx
+
+        if isinstance(formula, Implies):
+            antecedents.setdefault(get_fingerprint(formula.q), set()).add(
+                get_fingerprint(formula.p)
+            )
+
+    return antecedent_last_uses, conclusion_last_uses
+
+
+# The arena of the proof checked by a worker process of `assert_proof_is_valid`.
+_worker_arena = None
+
+
+def _init_worker(arena):
+    global _worker_arena
+    _worker_arena = arena
+
+
+def _check_axioms(handles):
+    return [is_axiom(_worker_arena.to_formula(h)) for h in handles]
+
+
+def _check_axioms_in_parallel(arena, handles, num_workers):
+    # Returns a dict from each handle in `handles` to whether it is an axiom.  The
+    # arena is shipped to each worker once, and the handles are split into several
+    # chunks per worker since some axioms take much longer to check than others.
+    unique_handles = list(dict.fromkeys(handles))
+    num_chunks = num_workers * 4
+    chunks = [unique_handles[i::num_chunks] for i in range(num_chunks)]
+    with concurrent.futures.ProcessPoolExecutor(
+        num_workers, initializer=_init_worker, initargs=(arena,)
+    ) as executor:
+        verdicts = executor.map(_check_axioms, chunks)
+        return dict(zip(itertools.chain(*chunks), itertools.chain(*verdicts)))
+
+
+def assert_proof_is_valid(proof, arena=None, num_workers=1, last_uses=None):
+    """Raises an `InvalidProofError` if `proof` is invalid, otherwise returns normally.
+
+    A proof is a list of `Formula`s where each formula is either an axiom
+    itself, or follows from a previous formula.  See the "What is a correct
+    proof" section in README.md for a longer explanation.
+
+    `proof` can be any iterable of steps and is consumed once, in order, so a
+    proof can be checked as it is generated or read, e.g. from a `.proof` file
+    with `proof_parser.iter_proof`.  Only the last comment and the formulae
+    needed for modus ponens are kept.
+
+    If `arena` is a `FormulaArena` then the formulae in `proof` are handles into
+    it (see `proof_to_arena`).
+
+    Given `last_uses` from `get_last_uses(proof)`, formulae are forgotten after
+    their last use.  This keeps the memory needed to check a streamed proof
+    proportional to the formulae that are still needed:
+
+        with open(path) as f:
+            last_uses = get_last_uses(iter_proof(f))
+        with open(path) as f:
+            assert_proof_is_valid(iter_proof(f), last_uses=last_uses)
+
+    With `num_workers` greater than 1, every step is checked for being an axiom
+    in that many worker processes first, and the steps that aren't axioms are
+    then checked in order as usual.  The result, including the reported error, is
+    the same as with a single worker.
+    """
+
+    if num_workers > 1:
+        # All the steps are needed up front to be sent to the workers.
+        proof = list(proof)
+        if arena is None:
+            arena, proof = proof_to_arena(proof)
+        handles = [step for step in proof if not _is_comment(step)]
+        verdicts = _check_axioms_in_parallel(arena, handles, num_workers)
+    else:
+        verdicts = None
+
+    checker = IncrementalProofChecker(arena, last_uses)
+    for step in proof:
+        if verdicts is None or _is_comment(step):
+            checker.append(step)
+        else:
+            checker._append(step, verdicts[step])
+
+
+def assert_certificate_is_valid(proof, certificate, arena=None):
+    """Raises an `InvalidProofError` unless every step of `proof` is justified the
+    way `certificate` says, otherwise returns normally.
+
+    `certificate` has an entry for each step of `proof`, which is one of:
+
+      None                          for comments
+      ("axiom", schema)             for an instance of the axiom schema named
+                                    `schema`, see `get_axiom_schema`
+      ("mp", impl_idx, ant_idx)     for the conclusion of the implication at step
+                                    `impl_idx` given its antecedent at step
+                                    `ant_idx`, both earlier steps
+
+    Unlike `assert_proof_is_valid`, nothing has to be searched for: each axiom
+    is checked against a single schema and every other step takes constant time.
+    A proof with a valid certificate is valid.  `ProofBuilder.certificate`
+    returns a certificate for the proof being built.
+
+    Malformed entries make their step invalid.  A `ValueError` is raised if
+    `certificate` and `proof` have different lengths.
+
+    If `arena` is a `FormulaArena` then the formulae in `proof` are handles into
+    it (see `proof_to_arena`).
+    """
+
+    if len(certificate) != len(proof):
+        raise ValueError(
+            f"Expected a certificate with {len(proof)} entries, "
+            + f"found {len(certificate)}"
+        )
+
+    # The formula at each step checked so far, or None for comments.
+    formulae = [None] * len(proof)
+    last_comment = None
+
+    for formula_idx, (step, justification) in enumerate(zip(proof, certificate)):
+        if _is_comment(step):
+            last_comment = step
+            continue
+
+        formula = step
+        if arena is not None:
+            formula = arena.to_formula(formula)
+
+        # Entries that don't have one of the shapes above are rejected like any
+        # other wrong justification.
+        ok = False
+        if not isinstance(justification, tuple) or len(justification) == 0:
+            pass
+        elif justification[0] == "axiom" and len(justification) == 2:
+            schema = justification[1]
+            ok = isinstance(schema, str) and is_axiom_of_schema(formula, schema)
+        elif justification[0] == "mp" and len(justification) == 3:
+            impl_idx = justification[1]
+            ant_idx = justification[2]
+            if (
+                isinstance(impl_idx, int)
+                and isinstance(ant_idx, int)
+                and 0 <= impl_idx < formula_idx
+                and 0 <= ant_idx < formula_idx
+            ):
+                impl = formulae[impl_idx]
+                ant = formulae[ant_idx]
+                ok = (
+                    isinstance(impl, Implies)
+                    and ant is not None
+                    and impl.q == formula
+                    and impl.p == ant
+                )
+
+        if not ok:
+            raise InvalidProofError(formula, formula_idx, last_comment)
+
+        formulae[formula_idx] = formula
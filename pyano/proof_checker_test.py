@@ -2,6 +2,7 @@ from proof_checker import *
 from formula import *
 from axioms import *
 from formula_helpers import *
+from proof_builder import ProofBuilder
 
 
 def test_proof_basic_0():
@@ -113,3 +114,205 @@ def test_one_plus_one_is_two_wrong_proof():
         return
 
     assert False, "Expected proof verification to fail"
+
+
+def test_thousand_plus_one():
+    thousand = Numeral(1000)
+    theorem = Eq(Add(thousand, Numeral(1)), Numeral(1001))
+
+    x_plus_succ_y = get_peano_axiom_x_plus_succ_y()
+    # 1000 + S(0) = S(1000 + 0)
+    x_plus_succ_y_subst_ = substitute_forall(x_plus_succ_y, thousand)
+    x_plus_succ_y_subst = substitute_forall(x_plus_succ_y_subst_, Zero())
+
+    x_plus_zero = get_peano_axiom_x_plus_zero()
+    x_plus_zero_subst = substitute_forall(x_plus_zero, thousand)
+
+    subst = Implies(x_plus_zero_subst, Implies(x_plus_succ_y_subst, theorem))
+
+    proof = [
+        x_plus_succ_y,
+        Implies(x_plus_succ_y, x_plus_succ_y_subst_),
+        x_plus_succ_y_subst_,
+        Implies(x_plus_succ_y_subst_, x_plus_succ_y_subst),
+        x_plus_succ_y_subst,
+        x_plus_zero,
+        Implies(x_plus_zero, x_plus_zero_subst),
+        x_plus_zero_subst,
+        subst,
+        subst.q,
+        theorem,
+    ]
+
+    assert_proof_is_valid(proof)
+
+    proof[-1] = Eq(Add(thousand, Numeral(1)), Numeral(1002))
+    try:
+        assert_proof_is_valid(proof)
+    except InvalidProofError as ipe:
+        assert ipe.invalid_formula_idx == len(proof) - 1
+        return
+
+    assert False, "Expected proof verification to fail"
+
+
+def test_incremental_proof_checker():
+    x_plus_zero = get_peano_axiom_x_plus_zero()
+    one_plus_zero = substitute_forall(x_plus_zero, Numeral(1))
+    both = And(one_plus_zero, one_plus_zero)
+
+    checker = IncrementalProofChecker()
+    checker.append("x + 0 = x")
+    checker.append(x_plus_zero)
+    checker.append("1 + 0 = 1")
+    try:
+        checker.append(one_plus_zero)
+    except InvalidProofError as ipe:
+        assert ipe.invalid_formula_idx == 3
+        assert ipe.last_comment == "1 + 0 = 1"
+    else:
+        assert False, "Expected proof verification to fail"
+
+    # The invalid step doesn't count as proved.
+    checker.append(Implies(one_plus_zero, both))
+    try:
+        checker.append(both)
+    except InvalidProofError as ipe:
+        assert ipe.invalid_formula_idx == 5
+    else:
+        assert False, "Expected proof verification to fail"
+
+    checker.append(Implies(x_plus_zero, one_plus_zero))
+    checker.append(one_plus_zero)
+    checker.append(both)
+    assert len(checker) == 9
+
+
+def test_append_checked():
+    x_plus_zero = get_peano_axiom_x_plus_zero()
+    one_plus_zero = substitute_forall(x_plus_zero, Numeral(1))
+    # Not an axiom, but trusted to be one.
+    both = And(one_plus_zero, one_plus_zero)
+
+    checker = IncrementalProofChecker()
+    checker.append_checked("trusted", None)
+    checker.append_checked(both, TAUTOLOGY)
+    checker.append_checked(Implies(both, x_plus_zero), TAUTOLOGY)
+    checker.append_checked(x_plus_zero, None)
+
+    # Steps without a schema must follow by modus ponens, even if they are axioms.
+    try:
+        checker.append_checked(Implies(x_plus_zero, one_plus_zero), None)
+    except InvalidProofError as ipe:
+        assert ipe.invalid_formula_idx == 4
+        assert ipe.last_comment == "trusted"
+    else:
+        assert False, "Expected proof verification to fail"
+
+
+def test_parallel_proof_checking():
+    builder = ProofBuilder()
+    builder.prove_eq_is_symmetric()
+    proof = builder.proof
+    assert_proof_is_valid(proof, num_workers=2)
+
+    # Errors are the same as with a single worker.
+    for idx in [0, len(proof) // 2, len(proof) - 1]:
+        invalid_proof = proof[:idx] + ["bad step", Eq(Zero(), Succ(Zero()))]
+        invalid_proof = invalid_proof + proof[idx:]
+        errors = []
+        for num_workers in [1, 3]:
+            try:
+                assert_proof_is_valid(invalid_proof, num_workers=num_workers)
+            except InvalidProofError as ipe:
+                errors.append((ipe.invalid_formula_idx, ipe.last_comment))
+        assert errors == [(idx + 1, "bad step")] * 2
+
+
+def test_certificates():
+    x_plus_zero = get_peano_axiom_x_plus_zero()
+    one_plus_zero = substitute_forall(x_plus_zero, Numeral(1))
+    proof = [
+        "x + 0 = x",
+        x_plus_zero,
+        Implies(x_plus_zero, one_plus_zero),
+        one_plus_zero,
+    ]
+    certificate = [
+        None,
+        ("axiom", FIRST_ORDER_PEANO),
+        ("axiom", FORALL_ELIMINATION),
+        ("mp", 2, 1),
+    ]
+    assert_certificate_is_valid(proof, certificate)
+
+    invalid_certificates = [
+        # The wrong schema.
+        (1, ("axiom", TAUTOLOGY)),
+        (2, ("axiom", "no such schema")),
+        # Modus ponens from the wrong steps, a comment or a later step.
+        (3, ("mp", 1, 2)),
+        (3, ("mp", 2, 0)),
+        (3, ("mp", 2, 3)),
+        (3, None),
+        # Malformed entries.
+        (3, 5),
+        (3, ()),
+        (3, ("mp",)),
+        (3, ("mp", "a", 0)),
+        (3, ("mp", 2, 1.0)),
+        (1, ("axiom", [FIRST_ORDER_PEANO])),
+        (1, ("axiom", FIRST_ORDER_PEANO, None)),
+    ]
+    for idx, justification in invalid_certificates:
+        invalid_certificate = list(certificate)
+        invalid_certificate[idx] = justification
+        try:
+            assert_certificate_is_valid(proof, invalid_certificate)
+        except InvalidProofError as ipe:
+            assert ipe.invalid_formula_idx == idx
+            assert ipe.last_comment == "x + 0 = x"
+        else:
+            assert False, f"Expected {justification} to be rejected"
+
+    for invalid_certificate in [certificate[:-1], certificate + [None]]:
+        try:
+            assert_certificate_is_valid(proof, invalid_certificate)
+        except ValueError as e:
+            assert not isinstance(e, InvalidProofError)
+        else:
+            assert False, "Expected the certificate's length to be rejected"
+
+
+def test_last_uses():
+    builder = ProofBuilder()
+    builder.prove_eq_is_transitive()
+    builder.prove_eq_is_symmetric()
+    proof = builder.proof
+
+    last_uses = get_last_uses(iter(proof))
+    checker = IncrementalProofChecker(last_uses=last_uses)
+    max_kept_formulae = 0
+    for step in proof:
+        checker.append(step)
+        max_kept_formulae = max(max_kept_formulae, checker.get_num_kept_formulae())
+    assert max_kept_formulae < len(proof) // 2
+    # Nothing is needed after the last step.
+    assert checker.get_num_kept_formulae() == 0
+
+    checker = IncrementalProofChecker()
+    for step in proof:
+        checker.append(step)
+    assert checker.get_num_kept_formulae() > len(proof) // 2
+
+    # Forgetting formulae doesn't change which step is reported.
+    for idx in range(len(proof)):
+        invalid_proof = proof[:idx] + proof[idx + 1 :]
+        errors = []
+        for last_uses in [None, get_last_uses(invalid_proof)]:
+            try:
+                assert_proof_is_valid(invalid_proof, last_uses=last_uses)
+                errors.append(None)
+            except InvalidProofError as ipe:
+                errors.append(ipe.invalid_formula_idx)
+        assert errors[0] == errors[1]
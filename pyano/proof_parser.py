@@ -0,0 +1,345 @@
+"""Parser for the text syntax of formulae and proofs.
+
+The syntax is the one `str(formula)` and `str(proof_builder)` print, so the proofs
+checked-in at `pyano/proved_theorems` can be read back and verified directly.
+"""
+
+from formula import *
+
+import re
+
+
+# Whitespace is skipped before each token.  The last alternative matches any other
+# character so that it can be reported as an error.
+_TOKEN_RE = re.compile(r"\s*(=>|[()!+*=&,.]|[A-Za-z_$][A-Za-z0-9_$]*|\S)")
+_NAME_RE = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*\Z")
+_PROOF_LINE_RE = re.compile(r"(\d+)\. ")
+_COMMENT_PREFIX = "# "
+
+# Subformulae are only cached this many levels deep, which bounds the time spent
+# building cache keys to a constant number of copies of the input.
+_MAX_CACHED_DEPTH = 32
+
+# Maximum number of subformulae `iter_proof` caches before starting over.
+_MAX_CACHED_SUBFORMULAE = 100000
+
+# Binary operators that are always printed inside their own parentheses, with the
+# type of their operands.
+_BINARY_OPS = {"+": (Add, Nat), "*": (Mul, Nat), "=": (Eq, Nat), "&": (And, Pred)}
+
+
+class ParseError(ValueError):
+    def __init__(self, message, text, position):
+        self._message = message
+        self._text = text
+        self._position = position
+
+    @property
+    def message(self):
+        return self._message
+
+    @property
+    def text(self):
+        return self._text
+
+    @property
+    def position(self):
+        return self._position
+
+    def __str__(self):
+        return f"{self.message} at position {self.position}:\n\n{self.text}"
+
+
+def _is_name(token):
+    return _NAME_RE.match(token) is not None
+
+
+def parse_formula(text, _cache=None):
+    """Parses a formula printed by `str`.
+
+    >>> f = parse_formula("(forall x, y. ((x + S(y)) = S((x + y))))")
+    >>> f == ForAll("x", ForAll("y", Eq(Add(Var("x"), Succ(Var("y"))),
+    ...                                 Succ(Add(Var("x"), Var("y"))))))
+    True
+
+    Implications are right associative, and `(exists x. P)` is read back as
+    `!(forall x. !P)`:
+
+    >>> print(parse_formula("(exists z. ((S(0) + z) = S(S(0)))) => (0 = 0) => (0 = 0)"))
+    (exists z. ((S(0) + z) = S(S(0)))) => (0 = 0) => (0 = 0)
+
+    The printer doesn't parenthesize the operand of `!`, so `!P => Q` is always
+    read as `(!P) => Q`.
+
+    """
+
+    tokens = _TOKEN_RE.findall(text)
+    try:
+        return _parse_tokens(tokens, {} if _cache is None else _cache)
+    except _TokenError as e:
+        positions = [m.start(1) for m in _TOKEN_RE.finditer(text)]
+        position = positions[e.index] if e.index < len(positions) else len(text)
+        raise ParseError(e.message, text, position) from None
+
+
+class _TokenError(Exception):
+    def __init__(self, message, index):
+        self.message = message
+        self.index = index
+
+
+def _parse_tokens(tokens, cache):
+    # The parser is a precedence climber with an explicit stack of pending frames,
+    # so deeply nested formulae can't overflow the Python stack.  Each frame is a
+    # list whose first element is the token that opened it and whose second is
+    # the key the frame's formula is cached under once it is parsed, if any:
+    #
+    #   ["!", None]               a negation waiting for its operand
+    #   ["S(", key]               a successor waiting for its operand and ")"
+    #   ["(", key, left, op]      parentheses, with the left operand and operator
+    #                             filled in once they've been parsed
+    #   ["forall", key, names]    a quantifier waiting for its body and ")"
+    #   ["exists", key, name]
+    #   ["=>", key, left]         an implication waiting for its right operand
+    #
+    # Proofs repeat the same subformulae over and over, so `cache` maps the tokens
+    # of every parenthesized subformula parsed so far, joined by spaces, to its
+    # formula and repeats are skipped over without being parsed again.  The
+    # conclusions of top-level implications are cached as well, since modus ponens
+    # makes them later steps of the proof.
+    line_key = " ".join(tokens)
+    value = cache.get(line_key)
+    if value is not None:
+        return value
+
+    frames = []
+    num_tokens = len(tokens)
+    i = 0
+    # Number of frames waiting for a ")", and number of frames with a cache key.
+    nesting = 0
+    cached_depth = 0
+
+    # Maps the index of each "(" to the index of the matching ")".
+    closing = {}
+    opening = []
+    for j, token in enumerate(tokens):
+        if token == "(":
+            opening.append(j)
+        elif token == ")" and opening:
+            closing[opening.pop()] = j
+
+    def expect(token):
+        nonlocal i
+        if i == num_tokens or tokens[i] != token:
+            raise _TokenError(f'Expected "{token}"', i)
+        i = i + 1
+
+    def expect_name():
+        nonlocal i
+        if i == num_tokens or not _is_name(tokens[i]):
+            raise _TokenError("Expected a variable name", i)
+        i = i + 1
+        return tokens[i - 1]
+
+    def check_type(value, t, index):
+        if not isinstance(value, t):
+            kind = "predicate" if t is Pred else "natural number"
+            raise _TokenError(f"Expected a {kind}, found {value}", index)
+
+    while True:
+        # Parse the prefix of an expression up to its first complete operand.
+        if i == num_tokens:
+            raise _TokenError("Unexpected end of formula", i)
+        token = tokens[i]
+        i = i + 1
+        if token == "!":
+            frames.append(["!", None])
+            continue
+
+        is_succ = token == "S" and i < num_tokens and tokens[i] == "("
+        if token == "(" or is_succ:
+            paren = i if is_succ else i - 1
+            key = None
+            value = None
+            if paren in closing and cached_depth < _MAX_CACHED_DEPTH:
+                key = " ".join(tokens[i - 1 : closing[paren] + 1])
+                value = cache.get(key)
+                cached_depth = cached_depth + 1
+            if value is not None:
+                i = closing[paren] + 1
+                cached_depth = cached_depth - 1
+            elif is_succ:
+                i = i + 1
+                frames.append(["S(", key])
+                nesting = nesting + 1
+                continue
+            elif i < num_tokens and tokens[i] == "forall":
+                i = i + 1
+                names = [expect_name()]
+                while i < num_tokens and tokens[i] == ",":
+                    i = i + 1
+                    names.append(expect_name())
+                expect(".")
+                frames.append(["forall", key, names])
+                nesting = nesting + 1
+                continue
+            elif i < num_tokens and tokens[i] == "exists":
+                i = i + 1
+                name = expect_name()
+                expect(".")
+                frames.append(["exists", key, name])
+                nesting = nesting + 1
+                continue
+            else:
+                frames.append(["(", key, None, None])
+                nesting = nesting + 1
+                continue
+        elif token == "0":
+            value = Zero()
+        elif _is_name(token) and token not in ("forall", "exists"):
+            value = Var(token)
+        else:
+            raise _TokenError("Expected a formula", i - 1)
+
+        # `value` is a complete operand.  Close every frame it completes, until one
+        # needs another operand.
+        while True:
+            while frames and frames[-1][0] == "!":
+                check_type(value, Pred, i - 1)
+                frames.pop()
+                value = Not(value)
+
+            token = tokens[i] if i < num_tokens else None
+            if token == "=>":
+                check_type(value, Pred, i)
+                i = i + 1
+                key = None
+                if nesting == 0 and cached_depth < _MAX_CACHED_DEPTH:
+                    key = " ".join(tokens[i:])
+                    conclusion = cache.get(key)
+                    if conclusion is not None:
+                        check_type(conclusion, Pred, i)
+                        value = Implies(value, conclusion)
+                        i = num_tokens
+                        continue
+                    cached_depth = cached_depth + 1
+                frames.append(["=>", key, value])
+                break
+
+            # The expression is complete, so pending implications can be built.
+            while frames and frames[-1][0] == "=>":
+                check_type(value, Pred, i - 1)
+                frame = frames.pop()
+                if frame[1] is not None:
+                    cache[frame[1]] = value
+                    cached_depth = cached_depth - 1
+                value = Implies(frame[2], value)
+
+            if not frames:
+                if token is not None:
+                    raise _TokenError("Expected end of formula", i)
+                cache[line_key] = value
+                return value
+
+            frame = frames[-1]
+            kind = frame[0]
+            if kind == "(" and frame[2] is None and token in _BINARY_OPS:
+                check_type(value, _BINARY_OPS[token][1], i)
+                i = i + 1
+                frame[2] = value
+                frame[3] = token
+                break
+
+            expect(")")
+            frames.pop()
+            nesting = nesting - 1
+            if kind == "S(":
+                check_type(value, Nat, i - 1)
+                # Runs of successors are stored as a single `Numeral`.
+                value = Numeral(1, value) if isinstance(value, Succ) else Succ(value)
+            elif kind == "forall":
+                check_type(value, Pred, i - 1)
+                for name in reversed(frame[2]):
+                    value = ForAll(name, value)
+            elif kind == "exists":
+                check_type(value, Pred, i - 1)
+                value = Not(ForAll(frame[2], Not(value)))
+            elif frame[2] is not None:
+                op, operand_type = _BINARY_OPS[frame[3]]
+                check_type(value, operand_type, i - 1)
+                value = op(frame[2], value)
+            if frame[1] is not None:
+                cache[frame[1]] = value
+                cached_depth = cached_depth - 1
+
+
+def iter_proof(lines):
+    """Parses the lines of a proof printed by `str(proof_builder)` one at a time,
+    yielding a formula for each step, or a string for each comment.
+
+    Any iterable of lines works, including an open `.proof` file, and only the
+    current line is kept, so a proof can be checked as it is read:
+
+    >>> lines = ["0. (forall x. (x = x))", "1. (forall x. (x = x)) => (0 = 0)"]
+    >>> [str(f) for f in iter_proof(lines)]
+    ['(forall x. (x = x))', '(forall x. (x = x)) => (0 = 0)']
+
+    Lines must be numbered from 0 without gaps; blank lines are ignored.  Comments
+    are printed after "# ", and every other step must be a predicate:
+
+    >>> list(iter_proof(["0. # reflexivity", "1. (forall x. (x = x))"]))[0]
+    'reflexivity'
+
+    A comment that spans several lines can't be read back, since each line after
+    the first is missing its step number.
+
+    """
+
+    num_steps = 0
+    # Shared between the lines, which repeat each other's subformulae.  It is
+    # emptied whenever it grows too large, which bounds the memory it uses.
+    cache = {}
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line or line.isspace():
+            continue
+
+        match = _PROOF_LINE_RE.match(line)
+        if match is None or int(match.group(1)) != num_steps:
+            raise ParseError(
+                f"Expected step number {num_steps} on line {line_number}", line, 0
+            )
+
+        text = line[match.end() :]
+        num_steps = num_steps + 1
+        if text.startswith(_COMMENT_PREFIX):
+            yield text[len(_COMMENT_PREFIX) :]
+            continue
+
+        if len(cache) > _MAX_CACHED_SUBFORMULAE:
+            cache.clear()
+        try:
+            formula = parse_formula(text, cache)
+        except ParseError as e:
+            message = f"{e.message} on line {line_number}"
+            raise ParseError(message, line, match.end() + e.position) from None
+        if not isinstance(formula, Pred):
+            message = f"Expected a predicate on line {line_number}"
+            raise ParseError(message, line, match.end())
+
+        yield formula
+
+
+def parse_proof(text):
+    """Parses a proof printed by `str(proof_builder)` into a list of formulae and
+    comments.
+
+    >>> proof = parse_proof("0. (forall x. (x = x))\\n1. (forall x. (x = x)) => (0 = 0)\\n")
+    >>> print(proof[1].q)
+    (0 = 0)
+
+    Lines must be numbered from 0 without gaps; blank lines are ignored.
+
+    """
+
+    return list(iter_proof(text.splitlines()))
@@ -0,0 +1,177 @@
+from proof_parser import *
+from proof_builder import *
+from proof_checker import *
+from formula import *
+from formula_helpers import *
+
+import os
+
+
+def _get_proved_theorems_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "proved_theorems")
+
+
+def test_parse_formula_round_trip():
+    fs = [
+        Zero(),
+        Numeral(3, Var("x")),
+        Mul(Add(Var("$0"), Succ(Zero())), Var("y")),
+        ForAll(
+            "x", ForAll("y", Implies(Eq(Var("x"), Var("y")), Eq(Var("y"), Var("x"))))
+        ),
+        Implies(Implies(Eq(Zero(), Zero()), Eq(Zero(), Zero())), Eq(Zero(), Zero())),
+        And(Implies(Eq(Zero(), Zero()), Eq(Zero(), Zero())), Not(Eq(Zero(), Zero()))),
+        Implies(Not(Eq(Zero(), Zero())), Eq(Zero(), Zero())),
+        LessThanOrEq(Succ(Zero()), Numeral(2)),
+        Or(Eq(Zero(), Zero()), ForAll("x", Eq(Var("x"), Zero()))),
+    ]
+    for f in fs:
+        parsed = parse_formula(str(f))
+        assert parsed == f
+        assert str(parsed) == str(f)
+
+
+def test_parse_formula_deep():
+    # Well past the Python recursion limit.
+    n = 20000
+    text = "(" * n + "0" + " + 0)" * n
+    f = parse_formula(text)
+    assert get_depth(f) == n + 1
+
+    f = parse_formula("(forall x. " + "!" * n + "(x = 0))")
+    assert get_depth(f) == n + 3
+
+
+def test_parse_formula_errors():
+    for text, position in [
+        ("(0 = 0", 6),
+        ("(0 = 0))", 7),
+        ("(0 & 0)", 3),
+        ("S(0) => (0 = 0)", 5),
+        ("(forall . (0 = 0))", 8),
+        ("(0 # 0)", 3),
+    ]:
+        try:
+            parse_formula(text)
+        except ParseError as e:
+            assert e.position == position, text
+            continue
+        assert False, f"Expected {text} to fail to parse"
+
+
+def test_parse_proof_errors():
+    try:
+        parse_proof("0. (0 = 0)\n2. (0 = 0)\n")
+    except ParseError as e:
+        assert e.message == "Expected step number 1 on line 2"
+    else:
+        assert False, "Expected parse to fail"
+
+
+def test_parse_proof_comments():
+    builder = ProofBuilder()
+    builder.p("reflexivity")
+    builder.prove_eq_is_symmetric()
+    builder.p("x = y => y = x, for every x and y")
+    builder.p("")
+    # Comments that look like formulae are still comments.
+    builder.p("(0 = 0)")
+    builder.p("!(0 = 0) => (forall x. ")
+    builder.p("# twice marked")
+    builder.flip_equality(builder.p(ForAll("x", Eq(Add(Var("x"), Zero()), Var("x")))))
+    proof = parse_proof(str(builder))
+    assert proof == builder.proof
+    assert proof[0] == "reflexivity"
+
+    # Steps that aren't comments must be predicates, so corrupted formulae and
+    # comments without the marker are rejected.
+    for text, message in [
+        ("0. (0 + 0)\n", "Expected a predicate on line 1"),
+        ("0. S(0)\n", "Expected a predicate on line 1"),
+        ("0. (x = \n", "Unexpected end of formula on line 1"),
+        ("0. 0 = 0)\n", "Expected end of formula on line 1"),
+        ("0. S(0) = 0\n", "Expected end of formula on line 1"),
+        ("0. reflexivity\n", "Expected a predicate on line 1"),
+        ("0. x + 0 = x\n", "Expected end of formula on line 1"),
+    ]:
+        try:
+            parse_proof(text)
+        except ParseError as e:
+            assert e.message == message, text
+        else:
+            assert False, f"Expected {text} to fail to parse"
+
+
+def test_checked_in_proofs():
+    root_dir = _get_proved_theorems_dir()
+    for theorem_file in os.listdir(root_dir):
+        with open(os.path.join(root_dir, theorem_file), "r") as f:
+            text = f.read()
+        proof = parse_proof(text)
+        assert "".join(f"{i}. {p}\n" for i, p in enumerate(proof)) == text
+        assert_proof_is_valid(proof)
+
+
+def test_streamed_proofs(monkeypatch):
+    # Small enough that the cache is emptied while the proofs are read.
+    monkeypatch.setattr("proof_parser._MAX_CACHED_SUBFORMULAE", 100)
+    root_dir = _get_proved_theorems_dir()
+    for theorem_file in os.listdir(root_dir):
+        path = os.path.join(root_dir, theorem_file)
+        with open(path, "r") as f:
+            assert_proof_is_valid(iter_proof(f))
+
+        # The formulae are parsed again for the second pass, after the first pass
+        # has dropped them.
+        with open(path, "r") as f:
+            last_uses = get_last_uses(iter_proof(f))
+        with open(path, "r") as f:
+            assert_proof_is_valid(iter_proof(f), last_uses=last_uses)
+
+
+def test_streamed_proof_errors():
+    # Steps are only read until the first invalid one.
+    lines = ["0. (forall x. (x = x))", "", "1. (0 = S(0))", "2. ((("]
+    try:
+        assert_proof_is_valid(iter_proof(lines))
+    except InvalidProofError as e:
+        assert e.invalid_formula_idx == 1
+    else:
+        assert False, "Expected the proof to be invalid"
+
+    try:
+        list(iter_proof(lines))
+    except ParseError as e:
+        assert e.message == "Unexpected end of formula on line 4"
+    else:
+        assert False, "Expected parse to fail"
+
+
+def test_streamed_proof_comments(tmp_path):
+    builder = ProofBuilder()
+    builder.p("symmetry")
+    builder.prove_eq_is_symmetric()
+    builder.p("x + 0 = x")
+    eq = builder.peano_axiom_x_plus_zero()
+    builder.flip_equality(eq)
+    proof = list(builder.proof)
+    invalid_idx = proof.index(eq) + 1
+    proof[invalid_idx] = Eq(Zero(), Succ(Zero()))
+
+    invalid_builder = ProofBuilder()
+    for step in proof:
+        invalid_builder.p(step)
+    path = tmp_path / "invalid.proof"
+    path.write_text(str(invalid_builder))
+
+    def get_error(steps):
+        try:
+            assert_proof_is_valid(steps)
+        except InvalidProofError as e:
+            return e.invalid_formula_idx, e.last_comment
+        return None
+
+    # The same error is reported as for the proof in memory.
+    assert get_error(proof) == (invalid_idx, "x + 0 = x")
+    with open(path) as f:
+        assert get_error(iter_proof(f)) == (invalid_idx, "x + 0 = x")
@@ -0,0 +1,45 @@
+"""Random formulae for the randomized tests, which compare the fast recognizers and
+matchers with simpler reference implementations.  This is a test helper and has no
+tests of its own."""
+
+from formula import *
+
+
+def random_term(rng, names, depth):
+    """Returns a random natural number at most `depth` levels deep, whose variables
+    are named from `names`.
+
+    """
+
+    choice = rng.randrange(5 if depth > 0 else 3)
+    if choice == 0:
+        return Zero()
+    elif choice == 1:
+        return Numeral(rng.randint(1, 2), Var(rng.choice(names)))
+    elif choice == 2:
+        return Var(rng.choice(names))
+    elif choice == 3:
+        return Succ(random_term(rng, names, depth - 1))
+    term_type = rng.choice([Add, Mul])
+    return term_type(
+        random_term(rng, names, depth - 1), random_term(rng, names, depth - 1)
+    )
+
+
+def random_pred(rng, names, depth):
+    """Returns a random predicate whose variables, free or bound, are named from
+    `names`.  Its terms are two levels deep, and it nests at most `depth` binders
+    and connectives around them.
+
+    """
+
+    choice = rng.randrange(4 if depth > 0 else 1)
+    if choice == 0:
+        return Eq(random_term(rng, names, 2), random_term(rng, names, 2))
+    elif choice == 1:
+        return ForAll(rng.choice(names), random_pred(rng, names, depth - 1))
+    elif choice == 2:
+        return Not(random_pred(rng, names, depth - 1))
+    return Implies(
+        random_pred(rng, names, depth - 1), random_pred(rng, names, depth - 1)
+    )
@@ -0,0 +1,123 @@
+"""A small DPLL solver for propositional formulae in conjunctive normal form."""
+
+
+def solve(num_vars, clauses):
+    """Returns a satisfying assignment for `clauses`, or None if there isn't one.
+
+    Variables are numbered from 1 to `num_vars` and each clause is a list of
+    non-zero integer literals, where `-v` is the negation of variable `v`.  The
+    assignment maps every variable to a bool.
+
+    >>> solve(2, [[1, 2], [-1], [-2, 1]]) is None
+    True
+    >>> solve(2, [[1, 2], [-1]])
+    {1: False, 2: True}
+    """
+
+    # values[v] is 1 if v is true, -1 if it is false and 0 if it is unassigned.
+    values = [0] * (num_vars + 1)
+
+    def value(lit):
+        v = values[abs(lit)]
+        return v if lit > 0 else -v
+
+    # Assigned literals in the order they were assigned, and the index into `trail`
+    # where each decision level starts, together with whether the decision that
+    # opened it has already been flipped.
+    trail = []
+    levels = []
+
+    def assign(lit):
+        values[abs(lit)] = 1 if lit > 0 else -1
+        trail.append(lit)
+
+    # Every clause with two or more literals watches its first two.  A clause only
+    # needs to be looked at when one of its watched literals becomes false.
+    watches = {}
+    units = []
+    for clause in clauses:
+        clause = list(dict.fromkeys(clause))
+        if any(-lit in clause for lit in clause):
+            # Always satisfied.
+            continue
+        if len(clause) == 0:
+            return None
+        elif len(clause) == 1:
+            units.append(clause[0])
+        else:
+            watches.setdefault(clause[0], []).append(clause)
+            watches.setdefault(clause[1], []).append(clause)
+
+    for lit in units:
+        if value(lit) == -1:
+            return None
+        if value(lit) == 0:
+            assign(lit)
+
+    # Index of the next literal in `trail` whose consequences haven't been
+    # propagated.
+    head = 0
+
+    def propagate():
+        # Returns False if propagation found a clause with all literals false.
+        nonlocal head
+        while head < len(trail):
+            false_lit = -trail[head]
+            head = head + 1
+            watching = watches.get(false_lit)
+            if not watching:
+                continue
+
+            i = 0
+            while i < len(watching):
+                clause = watching[i]
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], clause[0]
+                other = clause[0]
+                if value(other) == 1:
+                    i = i + 1
+                    continue
+
+                # Find another literal that isn't false to watch instead.
+                for k in range(2, len(clause)):
+                    if value(clause[k]) != -1:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        watches.setdefault(clause[1], []).append(clause)
+                        watching[i] = watching[-1]
+                        watching.pop()
+                        break
+                else:
+                    if value(other) == -1:
+                        return False
+                    assign(other)
+                    i = i + 1
+        return True
+
+    next_var = 1
+    while True:
+        if propagate():
+            while next_var <= num_vars and values[next_var] != 0:
+                next_var = next_var + 1
+            if next_var > num_vars:
+                return {v: values[v] == 1 for v in range(1, num_vars + 1)}
+            levels.append([len(trail), False])
+            assign(-next_var)
+            continue
+
+        # Undo the assignments back to the most recent decision that hasn't been
+        # flipped yet, and flip it.
+        while levels and levels[-1][1]:
+            levels.pop()
+        if not levels:
+            return None
+
+        start = levels[-1][0]
+        decision = trail[start]
+        for lit in trail[start:]:
+            values[abs(lit)] = 0
+        del trail[start:]
+        next_var = 1
+
+        levels[-1][1] = True
+        head = start
+        assign(-decision)
@@ -0,0 +1,42 @@
+from sat import *
+
+import itertools
+import random
+
+
+def _brute_force_solve(num_vars, clauses):
+    for values in itertools.product([False, True], repeat=num_vars):
+        if all(any(values[abs(lit) - 1] == (lit > 0) for lit in c) for c in clauses):
+            return True
+    return False
+
+
+def test_solve_random():
+    rng = random.Random(0)
+    for _ in range(500):
+        num_vars = rng.randint(1, 6)
+        clauses = [
+            [
+                rng.choice([-1, 1]) * rng.randint(1, num_vars)
+                for _ in range(rng.randint(0, 3))
+            ]
+            for _ in range(rng.randint(0, 12))
+        ]
+        assignment = solve(num_vars, clauses)
+        assert (assignment is not None) == _brute_force_solve(num_vars, clauses)
+        if assignment is not None:
+            for c in clauses:
+                assert any(assignment[abs(lit)] == (lit > 0) for lit in c)
+
+
+def test_solve_pigeonhole():
+    # Four pigeons don't fit in three holes.
+    def var(pigeon, hole):
+        return pigeon * 3 + hole + 1
+
+    clauses = [[var(p, h) for h in range(3)] for p in range(4)]
+    for h in range(3):
+        for p0, p1 in itertools.combinations(range(4), 2):
+            clauses.append([-var(p0, h), -var(p1, h)])
+    assert solve(12, clauses) is None
+    assert solve(12, clauses[1:]) is not None
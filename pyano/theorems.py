@@ -4,8 +4,10 @@ from axioms import *
 from formula_helpers import *
 from proof_builder import *
 
+import concurrent.futures
 import inspect
 import os
+import time
 
 
 def prove_adding_zero_commutes(b):
@@ -474,20 +476,57 @@ def prove_one_less_than_or_eq_two(b):
     p(theorem)
 
 
-def _iterate_proofs(callback):
-    for func_name, func in globals().items():
-        if not func_name.startswith("prove_"):
-            continue
-        theorem_name = func_name[len("prove_") :]
-        builder = ProofBuilder()
-        func(builder)
-        formulae_removed = builder.simplify_proof()
-        print(f"Optimizations removed {formulae_removed} formulae from {theorem_name}.")
-        assert_proof_is_valid(builder.proof)
-        callback(str(builder), theorem_name)
+# The lemmas shared by the theorems proved in this process.
+_worker_lemmas = None
 
 
-def _export_proofs(root_dir):
+def _init_worker():
+    global _worker_lemmas
+    _worker_lemmas = LemmaLibrary()
+
+
+def _prove_theorem(theorem_name):
+    # Returns the simplified and checked proof of `theorem_name` as text, with a
+    # line that reports how long it took.
+    start_time = time.perf_counter()
+    builder = ProofBuilder(lemmas=_worker_lemmas)
+    globals()[f"prove_{theorem_name}"](builder)
+    num_steps = len(builder.proof)
+    formulae_removed = builder.simplify_proof()
+    assert_proof_is_valid(builder.proof)
+    seconds = time.perf_counter() - start_time
+    report = (
+        f"Optimizations removed {formulae_removed} formulae from {theorem_name}, "
+        + f"{num_steps} -> {len(builder.proof)} steps, in {seconds:.3f}s."
+    )
+    return str(builder), report
+
+
+def _iterate_proofs(callback, num_workers=1):
+    # Theorems are proved in `num_workers` processes, but `callback` is always
+    # called in the order the theorems are defined in.
+    theorem_names = [
+        func_name[len("prove_") :]
+        for func_name in globals()
+        if func_name.startswith("prove_")
+    ]
+
+    def handle_results(results):
+        for theorem_name, (proof, report) in zip(theorem_names, results):
+            print(report)
+            callback(proof, theorem_name)
+
+    if num_workers == 1:
+        _init_worker()
+        handle_results(map(_prove_theorem, theorem_names))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            num_workers, initializer=_init_worker
+        ) as executor:
+            handle_results(executor.map(_prove_theorem, theorem_names))
+
+
+def _export_proofs(root_dir, num_workers=1):
     if not os.path.exists(root_dir):
         os.makedirs(root_dir)
 
@@ -496,10 +535,15 @@ def _export_proofs(root_dir):
             f.write(proof)
             print(f"Wrote {root_dir}/{theorem_name}.proof")
 
-    _iterate_proofs(write_proof_to_file)
+    _iterate_proofs(write_proof_to_file, num_workers)
+
+
+def assert_exported_proofs_match(root_dir, num_workers=1):
+    """Asserts that the proofs in `root_dir` are the ones the theorems in this module
+    generate, proving them in `num_workers` processes.
 
+    """
 
-def assert_exported_proofs_match(root_dir):
     theorem_files_checked = set()
 
     def assert_exported_proof_matches(proof, theorem_name):
@@ -507,7 +551,7 @@ def assert_exported_proofs_match(root_dir):
             assert "".join(f.readlines()) == proof
             theorem_files_checked.add(f"{theorem_name}.proof")
 
-    _iterate_proofs(assert_exported_proof_matches)
+    _iterate_proofs(assert_exported_proof_matches, num_workers)
 
     theorem_files = os.listdir(root_dir)
     for theorem_file in theorem_files:
@@ -517,7 +561,7 @@ def assert_exported_proofs_match(root_dir):
 
 
 def main():
-    _export_proofs(f"{os.getcwd()}/proved_theorems")
+    _export_proofs(f"{os.getcwd()}/proved_theorems", os.cpu_count() or 1)
 
 
 if __name__ == "__main__":
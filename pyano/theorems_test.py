@@ -12,8 +12,10 @@ def _check_proof(fn, theorem):
     builder = ProofBuilder()
     fn(builder)
     assert_proof_is_valid(builder.proof)
+    assert_certificate_is_valid(builder.proof, builder.certificate)
     builder.simplify_proof()
     assert_proof_is_valid(builder.proof)
+    assert_certificate_is_valid(builder.proof, builder.certificate)
     builder.assert_proved(theorem)
 
 
@@ -46,3 +48,9 @@ def test_prove_one_less_than_or_eq_two():
 
 def test_exported_proofs():
     assert_exported_proofs_match(f"{_get_git_root_dir()}/pyano/proved_theorems")
+
+
+def test_exported_proofs_in_parallel():
+    assert_exported_proofs_match(
+        f"{_get_git_root_dir()}/pyano/proved_theorems", num_workers=2
+    )